@@ -6,7 +6,7 @@ import subprocess
 # Uncomment these when deploying to the physical machine
 # from APCardManager import APCardManager
 # import channel
-# import gpib_api   # Assuming you have a wrapper for your Gpib calls
+# import instrbroker # VISA sessions shared with the other screens
 # import serial_api # Assuming you have a wrapper for your Serial calls
 
 # =====================================================
@@ -14,6 +14,9 @@ import subprocess
 # =====================================================
 PAGE_TITLE = "CGU CHECKS"
 
+# K1..K7 relay status lines, resolved once when the card is opened
+K_STATUS = tuple(f"K{i}_STATUS" for i in range(1, 8))
+
 COLOR_BG_MAIN = "#F0F2F5"       
 COLOR_PANEL_BG = "#FFFFFF"      
 COLOR_HEADER = "#1877F2"        
@@ -60,7 +63,8 @@ class CGUChecksGUI:
         # --- HARDWARE API INITIALIZATION (DISABLED FOR TESTING) ---
         # self.api = APCardManager()
         # self.api.ap_open()
-        # self.gpib = gpib_api.GpibManager()
+        # self.k_status = self.api.registry.inputs_of(K_STATUS)
+        # self.gpib = instrbroker.connect()
         # self.serial = serial_api.SerialManager()
 
         self.build_ui()
@@ -250,9 +254,9 @@ class CGUChecksGUI:
         """
         try:
             # Hypothetical reads mapping to C++ cgu1.k1 through cgu1.k7 updates
-            k_states[0] = "CLOSED" if self.api.ap_read_di(channel.K1_STATUS) == 1 else "OPEN"
-            k_states[1] = "CLOSED" if self.api.ap_read_di(channel.K2_STATUS) == 1 else "OPEN"
-            # ... repeat for K3-K7
+            di = self.api.read_di_snapshot(self.k_status)
+            for i, ch in enumerate(self.k_status):
+                k_states[i] = "CLOSED" if di[ch] == 1 else "OPEN"
         except Exception:
             pass
         """
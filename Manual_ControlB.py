@@ -428,10 +428,14 @@ class ControlChecksGUI:
         # --- HARDWARE DISABLED FOR TESTING ---
         """
         try:
-            # Replicate fetching from hardware
-            extVolt = self.api.ap_read_ai(channel.EXT_VOLT)
-            # ... fetches ...
-            wcVolt = self.api.ap_read_ai(channel.WING_CAGE)
+            # One oversampled scan of every analog channel per cycle
+            ai = self.api.scan_ai()
+            extVolt = ai["EXT_VOLT"]
+            extCurrent = ai["EXT_CURR"]
+            intVolt = ai["SIM_TB_VOLT"]
+            intCurrent = ai["SIM_TB_CURR"]
+            tbMonVolt = ai["TB_MON_VOLT"]
+            wcVolt = ai["WING_CAGE"]
         except Exception: pass
         """
 
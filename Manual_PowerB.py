@@ -12,6 +12,12 @@ import time
 # =====================================================
 PAGE_TITLE = "POWER ON CHECKS"
 
+# Latching relay behind each toggle button; the pulse runs off the Tk thread
+RELAY_OF_BUTTON = {"SAM COIL": "SAM_COIL", "OBP": "OBP", "SCU": "SCU", "CGU": "CGU",
+                   "RPF": "RPF", "TM": "TM", "INT SUPPLY": "IPS"}
+# How often the Tk loop checks a relay pulse for its status (ms)
+RELAY_POLL_MS = 20
+
 COLOR_BG_MAIN = "#F0F2F5"
 COLOR_PANEL_BG = "#FFFFFF"
 COLOR_HEADER = "#1877F2"
@@ -28,6 +34,10 @@ FONT_PANEL_TITLE = ("Helvetica", 13, "bold")
 FONT_LABEL = ("Helvetica", 11, "bold")
 FONT_VALUE = ("Helvetica", 12, "bold")
 
+# DI status bits shown on this page, read together each poll
+STATUS_CHANNELS = ("UMB1_STATUS", "UMB2_STATUS", "TM_STATUS", "PR_SWITCH_STATUS",
+                   "SAM_COIL_STATUS", "G_SWITCH_STATUS")
+
 # =====================================================
 # MAIN GUI CLASS
 # =====================================================
@@ -47,6 +57,7 @@ class PowerOnChecksGUI:
         # --- HARDWARE DISABLED FOR TESTING ---
         # self.api = APCardManager()
         # self.api.ap_open() # Open connection to the card
+        # self.status_chs = dict(zip(STATUS_CHANNELS, self.api.registry.inputs_of(STATUS_CHANNELS)))
         
         # Tracks current known UI state
         self.button_states = {
@@ -214,31 +225,32 @@ class PowerOnChecksGUI:
         
         # Uncomment this block later to re-enable actual hardware control
         """
-        actual_status = 0
+        if name in RELAY_OF_BUTTON:
+            relay = RELAY_OF_BUTTON[name]
+            try:
+                future = self.api.relay_on(relay) if intended_state else self.api.relay_off(relay)
+            except Exception as e:
+                messagebox.showerror("Hardware Error", f"Failed to send command to {name}.\nError: {e}")
+                return
+            self.root.after(RELAY_POLL_MS, lambda: self.finish_toggle(name, future))
+            return
+        """
+
+        self.apply_relay_state(name, is_actually_on)
+
+    def finish_toggle(self, name, future):
+        # Runs from root.after until the pulse has released and its status is known
+        if not future.done():
+            self.root.after(RELAY_POLL_MS, lambda: self.finish_toggle(name, future))
+            return
         try:
-            if name == "SAM COIL":
-                actual_status = self.api.sam_coil_on() if intended_state else self.api.sam_coil_off()
-            elif name == "OBP":
-                actual_status = self.api.obp_on() if intended_state else self.api.obp_off()
-            elif name == "SCU":
-                actual_status = self.api.scu_on() if intended_state else self.api.scu_off()
-            elif name == "CGU":
-                actual_status = self.api.cgu_on() if intended_state else self.api.cgu_off()
-            elif name == "RPF":
-                actual_status = self.api.rpf_on() if intended_state else self.api.rpf_off()
-            elif name == "TM":
-                actual_status = self.api.tm_on() if intended_state else self.api.tm_off()
-            elif name == "INT SUPPLY":
-                actual_status = self.api.ips_on() if intended_state else self.api.ips_off()
-            elif name == "EXT SUPPLY":
-                actual_status = 1 if intended_state else 0 
-
-            is_actually_on = (actual_status == 1)
+            actual_status = future.result()
         except Exception as e:
             messagebox.showerror("Hardware Error", f"Failed to send command to {name}.\nError: {e}")
             return
-        """
-        
+        self.apply_relay_state(name, actual_status == 1)
+
+    def apply_relay_state(self, name, is_actually_on):
         # For testing, we just link OBP state directly to the button state
         if name == "OBP":
             self.obpLink = 1 if is_actually_on else 0
@@ -256,8 +268,17 @@ class PowerOnChecksGUI:
 
         """
         try:
-            u1Status = self.api.ap_read_di(getattr(channel, 'UMB1_STATUS', 0)) or 0
-            # ... other reads ...
+            st = self.status_chs
+            di = self.api.read_di_snapshot(st.values())  # one read for every status bit shown
+            u1Status = di[st['UMB1_STATUS']]
+            u2Status = di[st['UMB2_STATUS']]
+            mslTmStatus = di[st['TM_STATUS']]
+            pSwitchStatus = di[st['PR_SWITCH_STATUS']]
+            samRelayStatus = di[st['SAM_COIL_STATUS']]
+            gSwitchStatus = di[st['G_SWITCH_STATUS']]
+            # No status lines for these in channel.py: show the last commanded state
+            gndPyroStatus = self.api.do_out.values.get(self.api.registry.output("BOOSTER_GND_RELAY"), 0)
+            nozzRelayStatus = 1 if self.api.latched.get("NE_PYRO") else 0
         except Exception:
             pass
         """
@@ -7,13 +7,18 @@ import time
 # Uncomment these when deploying to the actual hardware
 # import serial_api  # Mock representing your 'Serial' C++ object
 # import ipcard_api  # Mock representing your 'Ip' C++ object
+# from APCardManager import APCardManager, FIRE_DURATION
 # import channel     # Mock representing your channel constants
+# import channelmap
 
 # =====================================================
 # CONFIGURATION & THEME ("Facebook / Elegant" Style)
 # =====================================================
 PAGE_TITLE = "PYRO CHECKS"
 
+# How often the Tk loop checks a fire pulse for its release (ms)
+FIRE_POLL_MS = 50
+
 COLOR_BG_MAIN = "#F0F2F5"       
 COLOR_PANEL_BG = "#FFFFFF"      
 COLOR_HEADER = "#1877F2"        
@@ -55,6 +60,9 @@ class PyroChecksGUI:
         # --- HARDWARE API INITIALIZATION (DISABLED FOR TESTING) ---
         # self.serial = serial_api.SerialManager()
         # self.ip = ipcard_api.IpCardManager()
+        # self.registry = channelmap.load()
+        # self.api = APCardManager()  # fire lines are held on its timer, not by root.after
+        # self.api.ap_open()
 
         self.build_ui()
         self.init_hardware()
@@ -306,25 +314,21 @@ class PyroChecksGUI:
             self.ip.writeDo_A(channel.BOOSTER_GND_RELAY, 0)
             self.ip.writeDo_A(channel.THAB_GND_RELAY, 0)
 
-            self.ip.writeDo_A(channel.NOZZLE_PYRO_RELAY_ARM, 0)
-            self.ip.writeDo_A(channel.NOZZLE_PYRO_RELAY_SAFE, 1)
-            time.sleep(0.1)
-            self.ip.writeDo_A(channel.NOZZLE_PYRO_RELAY_SAFE, 0)
-
-            self.ip.writeDo_A(channel.PYRO_PS_ON, 0)
-            self.ip.writeDo_A(channel.PYRO_PS_OFF, 1)
-            time.sleep(0.1)
-            self.ip.writeDo_A(channel.PYRO_PS_OFF, 0)
-
-            self.ip.writeDo_A(channel.IPS_ON, 0)
-            self.ip.writeDo_A(channel.IPS_OFF, 1)
-            time.sleep(0.1)
-            self.ip.writeDo_A(channel.IPS_OFF, 0)
-
-            self.ip.writeDo_A(channel.PR_SWITCH_ON, 0)
-            self.ip.writeDo_A(channel.PR_SWITCH_OFF, 1)
+            # The four relay pairs are independent: drop them all to SAFE on one
+            # edge and share a single 100 ms pulse window
+            safe_pairs = [
+                (channel.NOZZLE_PYRO_RELAY_ARM, channel.NOZZLE_PYRO_RELAY_SAFE),
+                (channel.PYRO_PS_ON, channel.PYRO_PS_OFF),
+                (channel.IPS_ON, channel.IPS_OFF),
+                (channel.PR_SWITCH_ON, channel.PR_SWITCH_OFF),
+            ]
+            for on_ch, _ in safe_pairs:
+                self.ip.writeDo_A(on_ch, 0)
+            for _, off_ch in safe_pairs:
+                self.ip.writeDo_A(off_ch, 1)
             time.sleep(0.1)
-            self.ip.writeDo_A(channel.PR_SWITCH_OFF, 0)
+            for _, off_ch in safe_pairs:
+                self.ip.writeDo_A(off_ch, 0)
         except Exception: pass
         """
         
@@ -341,32 +345,37 @@ class PyroChecksGUI:
     # ACTION PANEL COMMANDS (Single Buttons)
     # -------------------------------------------------------------
     def fire_sequence(self, btn_name, cmd_string):
-        """ Replicates the 5-second blocking delay for Fire commands from C++ without freezing the GUI """
+        """ Replicates the 5-second Fire command from C++; the card's timer holds the line, the GUI only watches """
         btn = self.buttons[btn_name]
-        
-        # --- HARDWARE DISABLED FOR TESTING ---
-        """
-        try:
-            self.ip.writeDo_A(getattr(channel, cmd_string, 0), 1)
-        except Exception: pass
-        """
-        
-        print(f"[HW] SENDING COMMAND: Ip.writeDo_A({cmd_string}, 1)")
         btn.config(bg=COLOR_FAIL, fg="white") # Turns Red while firing
-        
-        # Schedule the OFF command after 5000ms
-        self.root.after(5000, lambda: self.end_fire_sequence(btn, cmd_string))
 
-    def end_fire_sequence(self, btn, cmd_string):
-        """ Callback to end the 5-second fire sequence """
         # --- HARDWARE DISABLED FOR TESTING ---
         """
         try:
-            self.ip.writeDo_A(getattr(channel, cmd_string, 0), 0)
-        except Exception: pass
+            future = self.api.timed_pulse(self.api.registry.output(cmd_string), FIRE_DURATION)
+        except Exception as e:
+            btn.config(bg=COLOR_WHITE, fg=COLOR_TEXT)
+            messagebox.showwarning("Error", f"{cmd_string} not fired: {e}")
+            return
+        self.root.after(FIRE_POLL_MS, lambda: self.end_fire_sequence(btn, cmd_string, future))
+        return
         """
-        print(f"[HW] SENDING COMMAND: Ip.writeDo_A({cmd_string}, 0)")
+
+        print(f"[HW] SENDING COMMAND: timed_pulse({cmd_string}, 5.0)")
+        self.root.after(5000, lambda: btn.config(bg=COLOR_WHITE, fg=COLOR_TEXT))
+
+    def end_fire_sequence(self, btn, cmd_string, future):
+        """ Polls the timed pulse from the Tk loop and reports its measured on-time """
+        if not future.done():
+            self.root.after(FIRE_POLL_MS, lambda: self.end_fire_sequence(btn, cmd_string, future))
+            return
         btn.config(bg=COLOR_WHITE, fg=COLOR_TEXT)
+        try:
+            on_time = future.result()
+        except Exception as e:
+            messagebox.showwarning("Error", f"{cmd_string} fire pulse failed: {e}")
+            return
+        print(f"[HW] {cmd_string} held for {on_time * 1000:.1f} ms")
 
     def on_vibration_clicked(self):
         status = -1
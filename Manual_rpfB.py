@@ -7,8 +7,9 @@ import time
 # Uncomment these when deploying to the actual hardware
 # import serial_api  # Mock representing your 'Serial' C++ object
 # import ipcard_api  # Mock representing your 'Ip' C++ object
-# import gpib_api    # Mock representing your 'Gpib' C++ object
+# import instrbroker # VISA sessions shared with the other screens
 # import channel     # Mock representing your channel constants
+# import channelmap
 
 # =====================================================
 # CONFIGURATION & THEME ("Facebook / Elegant" Style)
@@ -35,6 +36,12 @@ FONT_PANEL_TITLE = ("Helvetica", 13, "bold")
 FONT_LABEL = ("Helvetica", 11, "bold")
 FONT_VALUE = ("Helvetica", 12, "bold")
 
+# Attenuator button key -> relay name in channelmap.RELAY_TABLE
+ATTN_RELAYS = {
+    "1DB": "A1DB", "2DB": "A2DB", "4DB": "A4DB", "4DB2": "A4DB1",
+    "10DB": "A10DB", "20DB": "A20DB", "30DB": "A30DB", "30DB2": "A30DB1",
+}
+
 # =====================================================
 # MAIN GUI CLASS
 # =====================================================
@@ -60,7 +67,8 @@ class RPFChecksGUI:
         # --- HARDWARE API INITIALIZATION (DISABLED FOR TESTING) ---
         # self.serial = serial_api.SerialManager()
         # self.ip = ipcard_api.IpCardManager()
-        # self.gpib = gpib_api.GpibManager()
+        # self.registry = channelmap.load()
+        # self.gpib = instrbroker.connect()
 
         self.build_ui()
         self.init_hardware()
@@ -293,16 +301,19 @@ class RPFChecksGUI:
         """
         try:
             # Replicates: Ip.writeDo_A(AXDB_OFF, 0); Ip.writeDo_A(AXDB_ON, 1); delay(100); Ip.writeDo_A(AXDB_ON, 0);
+            # Registry lookup fails loudly on a bad key instead of pulsing channel 0
+            relay = self.registry.handle(ATTN_RELAYS[key])
+            on_ch, off_ch = self.registry.set_ch[relay], self.registry.reset_ch[relay]
             if state == "ON":
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_OFF", 0), 0)
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_ON", 0), 1)
+                self.ip.writeDo_A(off_ch, 0)
+                self.ip.writeDo_A(on_ch, 1)
                 time.sleep(0.1)
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_ON", 0), 0)
+                self.ip.writeDo_A(on_ch, 0)
             else:
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_ON", 0), 0)
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_OFF", 0), 1)
+                self.ip.writeDo_A(on_ch, 0)
+                self.ip.writeDo_A(off_ch, 1)
                 time.sleep(0.1)
-                self.ip.writeDo_A(getattr(channel, f"A{val}DB_OFF", 0), 0)
+                self.ip.writeDo_A(off_ch, 0)
             hardware_success = True
         except Exception: pass
         """
@@ -333,7 +344,7 @@ class RPFChecksGUI:
             for p in range(8):
                 self.ip.writeOptoDo_A(p, 1)
             time.sleep(0.1)
-            self.ip.writeOptoDo_A(getattr(channel, f"DL{val}", 0), 0)
+            self.ip.writeOptoDo_A(channelmap.resolve(f"DL{val}"), 0)
             hardware_success = True
         except Exception: pass
         """
@@ -463,7 +474,8 @@ class RPFChecksGUI:
         # --- HARDWARE DISABLED FOR TESTING ---
         """
         try:
-            temp = self.gpib.firingPulseOscAmplitude(fpAmp, fpWidth)
+            temp, result = self.gpib.firingPulseOscAmplitude((2,))
+            fpAmp, fpWidth = result[2]
         except Exception: pass
         """
         temp = 1 # Bypass (1 represents success in C++)
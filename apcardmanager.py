@@ -1,377 +1,1230 @@
+import atexit
 import ctypes
+import functools
+import heapq
+import itertools
+import os
+import queue
+import signal
+import threading
 import time
-import channel
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+import numpy as np
+import channelmap
+from iotrace import IOTracer, ReplayCard, TracingCard
+from limitengine import LimitEngine
 from limits import Limits
 
-class APCardManager:
+DI_PORTS = 6
+DI_PORT_WIDTH = 8
+DI_CHANNELS = DI_PORTS * DI_PORT_WIDTH
+DI_ALL = (1 << DI_CHANNELS) - 1
+DO_PORT_WIDTH = 8
+OPTO_PORT_WIDTH = 8
+
+PULSE_WIDTH = 0.1
+STATUS_POLL_INTERVAL = 0.002
+
+# Service mode queue priorities, lower runs first
+PRIO_TIMED = 0
+PRIO_OPERATOR = 1
+PRIO_POLL = 2
+WORKER_QUEUE_DEPTH = 64
+
+DI_WATCH_RATE = 1000
+# Seconds between repeated "DI watch read failed" prints
+DI_WATCH_ERROR_INTERVAL = 5.0
+
+FIRE_DURATION = 5.0
+# Timed pulses sleep until this close to the deadline, then spin
+FIRE_SPIN = 0.002
+
+# RPF step attenuator pads, relay name -> dB when switched in
+ATTENUATOR_PADS = (
+    ("A1DB", 1), ("A2DB", 2), ("A4DB", 4), ("A4DB1", 4),
+    ("A10DB", 10), ("A20DB", 20), ("A30DB", 30), ("A30DB1", 30),
+)
+# Net attenuation of every pad combination, bit i = ATTENUATOR_PADS[i] switched in
+ATTENUATOR_COMBOS = [
+    (mask, sum(db for i, (_, db) in enumerate(ATTENUATOR_PADS) if mask >> i & 1))
+    for mask in range(1 << len(ATTENUATOR_PADS))
+]
+
+# Analog inputs read by the windows, scanned together; names missing from channel.py are skipped
+AI_SCAN = ("EXT_VOLT", "EXT_CURR", "SIM_TB_VOLT", "SIM_TB_CURR", "TB_MON_VOLT",
+           "SUSTAINER_RLY", "NOZZLE_MATE", "WING_CAGE")
+AI_SCAN_SAMPLES = 16
+
+# Relays dropped by ALL SAFE, each driven to its reset side
+ALL_SAFE_RELAYS = ("NE_PYRO", "PYRO_PS", "IPS", "PR_SWITCH")
+
+
+DIEvent = namedtuple("DIEvent", "timestamp channel value")
+
+
+class DISnapshot:
+    # One read of the DI ports packed into an int, bit n = DI channel n;
+    # valid has a bit set for every channel the read actually covered
+    __slots__ = ("mask", "timestamp", "valid")
+
+    def __init__(self, mask, timestamp, valid=DI_ALL):
+        self.mask = mask & valid
+        self.timestamp = timestamp
+        self.valid = valid
+
+    def __getitem__(self, ch):
+        if isinstance(ch, str):
+            ch = channelmap.load().input(ch)
+        if not (self.valid >> ch) & 1:
+            raise KeyError(f"DI channel {ch} was not read in this snapshot")
+        return (self.mask >> ch) & 1
+
+    def __int__(self):
+        return self.mask
+
+    def __eq__(self, other):
+        return isinstance(other, DISnapshot) and self.mask == other.mask and self.valid == other.valid
+
+    def __repr__(self):
+        if self.valid != DI_ALL:
+            return f"DISnapshot(0x{self.mask:0{DI_CHANNELS // 4}X}, valid=0x{self.valid:0{DI_CHANNELS // 4}X})"
+        return f"DISnapshot(0x{self.mask:0{DI_CHANNELS // 4}X})"
+
+    def changed(self, other):
+        # Only bits both snapshots read can have changed
+        return (self.mask ^ other.mask) & self.valid & other.valid
+
+
+class AIScanResult:
+    # Per-channel statistics of one scan cycle, indexable by channel name
+    __slots__ = ("names", "mean", "min", "max", "std", "timestamp")
+
+    def __init__(self, names, samples, timestamp):
+        self.names = names
+        self.mean = samples.mean(axis=0)
+        self.min = samples.min(axis=0)
+        self.max = samples.max(axis=0)
+        self.std = samples.std(axis=0)
+        self.timestamp = timestamp
+
+    def __getitem__(self, name):
+        return float(self.mean[self.names.index(name)])
+
+
+class OutputShadow:
+    # Last commanded value per output line; skips repeats and, inside a
+    # coalesce block, folds changes on one port into a single port write
+    def __init__(self, write_bit, write_port=None, width=8, raise_first=False):
+        self.write_bit = write_bit
+        self.write_port = write_port
+        self.width = width
+        self.raise_first = raise_first
+        self.values = {}
+        self.pending = None
+        self.writes = 0
+        self.port_writes = 0
+        self.skipped = 0
+        self.coalesced = 0
+
+    def write(self, ch, value, force=False):
+        if self.pending is not None:
+            self.pending[ch] = (value, force)
+            return 0
+        if not force and self.values.get(ch) == value:
+            self.skipped += 1
+            return 0
+        self.writes += 1
+        ret = self.write_bit(ch, value)
+        self.values[ch] = value
+        return ret
+
+    def begin(self):
+        self.pending = {}
+
+    def flush(self):
+        pending, self.pending = self.pending, None
+        ports = {}
+        forced = set()
+        for ch, (value, force) in pending.items():
+            if not force and self.values.get(ch) == value:
+                self.skipped += 1
+                continue
+            ports.setdefault(ch // self.width, {})[ch] = value
+            if force:
+                forced.add(ch // self.width)
+        for port, bits in ports.items():
+            base = port * self.width
+            lines = range(base, base + self.width)
+            # A forced write does not trust the shadow, so never rebuild its port from it
+            if port in forced:
+                self._write_bits(bits)
+            elif self.write_port is not None and len(bits) > 1 and all(ch in bits or ch in self.values for ch in lines):
+                mask = 0
+                for ch in lines:
+                    if bits.get(ch, self.values.get(ch)):
+                        mask |= 1 << (ch - base)
+                self.write_port(port, mask)
+                self.port_writes += 1
+                self.coalesced += len(bits) - 1
+                self.values.update(bits)
+            else:
+                self._write_bits(bits)
+
+    def _write_bits(self, bits):
+        # Relay coils are dropped before any is raised; the active-low opto selects
+        # are raised first so two lines are never low together
+        ret = 0
+        for level in ((1, 0) if self.raise_first else (0, 1)):
+            for ch, value in bits.items():
+                if value == level:
+                    self.writes += 1
+                    ret = self.write_bit(ch, value)
+                    self.values[ch] = value
+        return ret
+
+    def port_value(self, port):
+        base = port * self.width
+        mask = 0
+        for bit in range(self.width):
+            value = self.values.get(base + bit)
+            if value is None:
+                return None
+            if value:
+                mask |= 1 << bit
+        return mask
+
+    def write_port_mask(self, port, mask, force=False):
+        base = port * self.width
+        new = {base + bit: (mask >> bit) & 1 for bit in range(self.width)}
+        if self.pending is not None:
+            for ch, value in new.items():
+                self.pending[ch] = (value, force)
+            return 0
+        changed = {ch: value for ch, value in new.items() if force or self.values.get(ch) != value}
+        if not changed:
+            self.skipped += 1
+            return 0
+        if self.write_port is None:
+            return self._write_bits(changed)
+        self.port_writes += 1
+        ret = self.write_port(port, mask)
+        self.values.update(new)
+        return ret
+
+    def update_port(self, port, high, low):
+        current = self.port_value(port)
+        if current is not None and self.write_port is not None:
+            return self.write_port_mask(port, (current | high) & ~low)
+        base = port * self.width
+        bits = {}
+        for bit in range(self.width):
+            if high >> bit & 1:
+                bits[base + bit] = 1
+            elif low >> bit & 1:
+                bits[base + bit] = 0
+        if self.pending is not None:
+            for ch, value in bits.items():
+                self.pending[ch] = (value, False)
+            return 0
+        changed = {ch: value for ch, value in bits.items() if self.values.get(ch) != value}
+        self.skipped += len(bits) - len(changed)
+        return self._write_bits(changed)
+
+    def invalidate(self, ch=None):
+        if ch is None:
+            self.values.clear()
+        else:
+            self.values.pop(ch, None)
+
+
+class TimingStats:
+    # Running count/mean/min/max of a duration in seconds (relay actuation, queue latency)
     def __init__(self):
-        self.card = ctypes.CDLL("libacromag.so")
+        self.count = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.last = elapsed
+        self.min = elapsed if self.min is None else min(self.min, elapsed)
+        self.max = elapsed if self.max is None else max(self.max, elapsed)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def __repr__(self):
+        if not self.count:
+            return f"TimingStats(n=0, timeouts={self.timeouts})"
+        return (f"TimingStats(n={self.count}, mean={self.mean * 1000:.1f}ms, "
+                f"min={self.min * 1000:.1f}ms, max={self.max * 1000:.1f}ms, timeouts={self.timeouts})")
+
+
+class _RelayPulse:
+    __slots__ = ("future", "name", "ch", "status_ch", "expected", "t0", "deadline",
+                 "released", "actuated", "timed_out", "value", "ret")
+
+    def __init__(self, future, name, ch, status_ch, expected, t0, deadline):
+        self.future = future
+        self.name = name
+        self.ch = ch
+        self.status_ch = status_ch
+        self.expected = expected
+        self.t0 = t0
+        self.deadline = deadline
+        self.released = False
+        self.actuated = False
+        self.timed_out = False
+        self.value = None
+        self.ret = None
+
+
+class EdgeScheduler:
+    # Single timer thread running callbacks at monotonic deadlines; with spin > 0 the
+    # last stretch before each deadline is busy-waited for sub-millisecond accuracy
+    def __init__(self, name="apcard-edges", spin=0.0):
+        self.name = name
+        self.spin = spin
+        self._queue = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._thread = None
+        # Set in service mode to hand due callbacks to the card worker
+        self.dispatch = None
+
+    def call_at(self, deadline, fn, *args):
+        with self._cv:
+            heapq.heappush(self._queue, (deadline, next(self._seq), fn, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cv.notify()
+
+    def call_later(self, delay, fn, *args):
+        self.call_at(time.monotonic() + delay, fn, *args)
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while not self._queue:
+                    self._cv.wait()
+                deadline = self._queue[0][0]
+                remaining = deadline - time.monotonic()
+                if remaining > self.spin:
+                    self._cv.wait(remaining - self.spin)
+                    continue
+                _, _, fn, args = heapq.heappop(self._queue)
+            while time.monotonic() < deadline:
+                pass
+            try:
+                if self.dispatch is not None:
+                    self.dispatch(fn, *args)
+                else:
+                    fn(*args)
+            except Exception as e:
+                print("APCard: scheduled edge failed:", e)
+
+
+class CardWorker:
+    # Owns the card in service mode: one thread draining a bounded priority queue
+    def __init__(self, maxsize=WORKER_QUEUE_DEPTH):
+        self.maxsize = maxsize
+        self._heap = []
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self.max_depth = 0
+        self.stopped = False
+        self.queue_wait = TimingStats()
+        self.service_time = TimingStats()
+        self.thread = threading.Thread(target=self._run, name="apcard-io", daemon=True)
+        self.thread.start()
+
+    def depth(self):
+        with self._cv:
+            return len(self._heap)
+
+    def submit(self, fn, *args, priority=PRIO_OPERATOR, block=True):
+        future = Future()
+        with self._cv:
+            if self.stopped:
+                raise RuntimeError("APCard worker is stopped")
+            # Timed edges are never held back by a full queue
+            while priority > PRIO_TIMED and len(self._heap) >= self.maxsize:
+                if not block:
+                    raise queue.Full
+                self._cv.wait()
+            heapq.heappush(self._heap, (priority, next(self._seq), time.monotonic(), future, fn, args))
+            self.max_depth = max(self.max_depth, len(self._heap))
+            self._cv.notify_all()
+        return future
+
+    def stop(self):
+        self.submit(None, priority=PRIO_POLL + 1)
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def wait(self, future):
+        # A command running on the worker that waits on a pulse keeps servicing
+        # timed edges, otherwise the edge it is waiting for could never run
+        if threading.current_thread() is not self.thread:
+            return future.result()
+        while not future.done():
+            item = self._next(PRIO_TIMED, 0.01)
+            if item is not None:
+                self._execute(item)
+        return future.result()
+
+    def _next(self, max_priority=None, timeout=None):
+        with self._cv:
+            while not self._heap or (max_priority is not None and self._heap[0][0] > max_priority):
+                if not self._cv.wait(timeout) and timeout is not None:
+                    return None
+            item = heapq.heappop(self._heap)
+            self._cv.notify_all()
+            return item
+
+    def _execute(self, item):
+        _, _, submitted, future, fn, args = item
+        if not future.set_running_or_notify_cancel():
+            return
+        start = time.monotonic()
+        self.queue_wait.add(start - submitted)
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        self.service_time.add(time.monotonic() - start)
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item[4] is None:
+                with self._cv:
+                    self.stopped = True
+                item[3].set_result(None)
+                return
+            self._execute(item)
+
+
+class DIWatcher:
+    # Samples the subscribed DI lines at a fixed rate and publishes only the bits that changed
+    def __init__(self, api, rate=DI_WATCH_RATE):
+        self.api = api
+        self.period = 1.0 / rate
+        self.last = None
+        self.samples = 0
+        self.overruns = 0
+        self.read_errors = 0
+        self._error_printed = None
+        self._subscribers = []
+        # Lines read each sample, None for all of them
+        self._channels = ()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def subscribe(self, callback, channels=None):
+        # callback(events) runs on the watcher thread; channels limits it to those DI lines
+        mask = -1
+        if channels is not None:
+            mask = 0
+            for ch in channels:
+                mask |= 1 << (self.api.registry.input(ch) if isinstance(ch, str) else ch)
+        with self._lock:
+            self._subscribers.append((mask, callback))
+            self._update_channels()
+        return callback
+
+    def subscribe_queue(self, channels=None):
+        # For Tk windows: drain the queue from root.after instead of touching widgets here
+        events = queue.SimpleQueue()
+        self.subscribe(lambda evs: [events.put(e) for e in evs], channels)
+        return events
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(m, cb) for m, cb in self._subscribers if cb is not callback]
+            self._update_channels()
+
+    def _update_channels(self):
+        union = 0
+        for mask, _ in self._subscribers:
+            union |= mask
+        self._channels = None if union < 0 else tuple(ch for ch in range(DI_CHANNELS) if union >> ch & 1)
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="apcard-di-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        next_t = time.monotonic()
+        reading = ()
+        while self._running:
+            with self._lock:
+                channels = self._channels
+            if channels != reading:
+                # A new line set starts a new baseline, not a burst of false changes
+                reading = channels
+                self.last = None
+            snap = None
+            if channels != ():
+                try:
+                    snap = self.api.poll(self.api.read_di_snapshot, channels).result()
+                except Exception as e:
+                    self._read_failed(e)
+            if snap is not None:
+                self.samples += 1
+                if self.last is not None:
+                    diff = snap.changed(self.last)
+                    if diff:
+                        self._publish(snap, diff)
+                self.last = snap
+            next_t += self.period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.overruns += 1
+                next_t = time.monotonic()
+
+    def _read_failed(self, e):
+        self.read_errors += 1
+        now = time.monotonic()
+        if self._error_printed is None or now - self._error_printed >= DI_WATCH_ERROR_INTERVAL:
+            self._error_printed = now
+            print(f"APCard: DI watch read failed ({self.read_errors} so far):", e)
+
+    def _publish(self, snap, diff):
+        events = []
+        while diff:
+            low = diff & -diff
+            ch = low.bit_length() - 1
+            events.append(DIEvent(snap.timestamp, ch, (snap.mask >> ch) & 1))
+            diff ^= low
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for mask, callback in subscribers:
+            mine = [e for e in events if mask >> e.channel & 1]
+            if mine:
+                try:
+                    callback(mine)
+                except Exception as e:
+                    print("APCard: DI watch subscriber failed:", e)
+
+
+def _on_worker(fn):
+    # Service mode: a call from any other thread is queued to the card worker and waited for
+    @functools.wraps(fn)
+    def call(self, *args, **kwargs):
+        worker = self.worker
+        if worker is None or threading.current_thread() is worker.thread:
+            return fn(self, *args, **kwargs)
+        return worker.submit(functools.partial(fn, self, *args, **kwargs)).result()
+    return call
+
+
+class APCardManager:
+    def __init__(self, card=None, backend=None, tracer=None):
+        if card is None:
+            backend = backend or os.environ.get("APCARD_BACKEND", "hw")
+            if backend == "sim":
+                from simcard import SimulatedCard
+                card = SimulatedCard()
+            elif backend == "replay":
+                card = ReplayCard(os.environ["APCARD_REPLAY"], realtime=os.environ.get("APCARD_REPLAY_REALTIME") == "1")
+            elif backend == "hw":
+                card = ctypes.CDLL("libacromag.so")
+            else:
+                raise ValueError(f"unknown APCard backend: {backend}")
+        trace_path = os.environ.get("APCARD_TRACE")
+        if tracer is None and trace_path:
+            tracer = IOTracer()
+            tracer.dump_on_crash(trace_path)
+        if tracer is not None:
+            card = TracingCard(card, tracer)
+        self.tracer = tracer
+        self.card = card
         self.limits = Limits()
+        # {scan name: (low, high)} checked by check_limits(), None for an open side
+        self.ai_limits = {}
+        # Older libacromag builds only export the per-bit read
+        self._has_di_port = hasattr(self.card, "ap_read_di_port")
+        self._io_lock = threading.RLock()
+        self.do_out = OutputShadow(self.card.ap_write_do, getattr(self.card, "ap_write_do_port", None), DO_PORT_WIDTH)
+        self.opto_out = OutputShadow(self.card.ap_write_opto_do, getattr(self.card, "ap_write_opto_port", None), OPTO_PORT_WIDTH, raise_first=True)
+        self.edges = EdgeScheduler()
+        self.fire_timer = EdgeScheduler("apcard-fire", spin=FIRE_SPIN)
+        self._timed_active = {}
+        self._timed_guard = False
+        self.registry = channelmap.load()
+        self._all_safe = self.registry.handles_of(ALL_SAFE_RELAYS)
+        self._atten_pads = self.registry.handles_of(name for name, _ in ATTENUATOR_PADS)
+        out, opto = self.registry.output, self.registry.opto_line
+        self._gnd_relays = (out("BOOSTER_GND_RELAY"), out("THAB_GND_RELAY"))
+        self._g_switch = out("G_SWITCH_CLOSE")
+        self._fire = {name: out(name) for name in ("BOOSTER_FIRE", "THBATTERY_FIRE", "AIRBOTTLE_FIRE")}
+        self._cgu_fin1 = (opto("CGUTX1"), opto("CGURX1"))
+        self._cgu_fin3 = (opto("CGUTX3"), opto("CGURX3"))
+        self._rpf_tx = (opto("RPFTX1"), opto("RPFTX2"))
+        self.last_all_safe_ms = None
+        self.worker = None
+        self.di_watch = None
+        # Scan list is set up on first use so a missing analog channel never stops the card layer
+        self.ai_scan_names = None
+        self.actuation = {name: TimingStats() for name in self.registry.names}
+        # Last commanded side of each latching relay; absent until first pulsed
+        self.latched = {}
 
     def ap_open(self):
-        return self.card.ap_open()
+        with self._io_lock:
+            # Output state after open is whatever the card powered up with
+            self.do_out.invalidate()
+            self.opto_out.invalidate()
+            return self.card.ap_open()
 
     def ap_close(self):
-        return self.card.ap_close()
+        with self._io_lock:
+            return self.card.ap_close()
 
+    @_on_worker
     def ap_read_di(self, ch):
-        return self.card.ap_read_di(ch)
+        with self._io_lock:
+            return self.card.ap_read_di(ch)
+
+    @_on_worker
+    def ap_read_di_port(self, port):
+        with self._io_lock:
+            if self._has_di_port:
+                return self.card.ap_read_di_port(port) & 0xFF
+            base = port * DI_PORT_WIDTH
+            value = 0
+            for bit in range(DI_PORT_WIDTH):
+                if self.card.ap_read_di(base + bit):
+                    value |= 1 << bit
+            return value
+
+    @_on_worker
+    def ap_read_di_all(self, ports=None):
+        if ports is None:
+            ports = range(DI_PORTS)
+        mask = valid = 0
+        port_bits = (1 << DI_PORT_WIDTH) - 1
+        with self._io_lock:
+            for port in ports:
+                mask |= self.ap_read_di_port(port) << (port * DI_PORT_WIDTH)
+                valid |= port_bits << (port * DI_PORT_WIDTH)
+        return DISnapshot(mask, time.monotonic(), valid)
+
+    @_on_worker
+    def read_di_snapshot(self, channels=None):
+        # channels limits the read to the status bits a caller needs; indexing a bit not read raises.
+        # With the port read that is the ports holding them, without it one call per channel
+        # instead of the 48 per-bit calls of a full emulated snapshot.
+        if channels is None:
+            return self.ap_read_di_all()
+        chs = [self.registry.input(ch) if isinstance(ch, str) else ch for ch in channels]
+        if self._has_di_port:
+            return self.ap_read_di_all(sorted({ch // DI_PORT_WIDTH for ch in chs}))
+        mask = valid = 0
+        with self._io_lock:
+            for ch in chs:
+                valid |= 1 << ch
+                if self.card.ap_read_di(ch):
+                    mask |= 1 << ch
+        return DISnapshot(mask, time.monotonic(), valid)
 
-    def ap_write_do(self, ch, value):
-        return self.card.ap_write_do(ch, value)
+    @_on_worker
+    def ap_write_do(self, ch, value, force=False):
+        with self._io_lock:
+            return self.do_out.write(ch, value, force)
 
+    @_on_worker
     def ap_read_ai(self, ch):
-        return self.card.ap_read_ai(ch)
+        with self._io_lock:
+            return self.card.ap_read_ai(ch)
         
-    def ap_write_opto_do(self, ch, value):
-        return self.card.ap_write_opto_do(ch, value)
+    @_on_worker
+    def ap_write_opto_do(self, ch, value, force=False):
+        with self._io_lock:
+            return self.opto_out.write(ch, value, force)
+
+    @_on_worker
+    def ap_write_opto_port(self, mask, port=0, force=False):
+        # One byte-wide write, emulated per bit when libacromag has no port write
+        with self._io_lock:
+            return self.opto_out.write_port_mask(port, mask & 0xFF, force)
+
+    @_on_worker
+    def ap_update_opto_lines(self, high=(), low=()):
+        # Drive the given opto lines, leaving the rest of their ports as last written
+        ports = {}
+        for level, chs in ((0, high), (1, low)):
+            for ch in chs:
+                masks = ports.setdefault(ch // OPTO_PORT_WIDTH, [0, 0])
+                masks[level] |= 1 << (ch % OPTO_PORT_WIDTH)
+        with self._io_lock:
+            for port, (high_mask, low_mask) in ports.items():
+                self.opto_out.update_port(port, high_mask, low_mask)
+
+    @contextmanager
+    def coalesce(self):
+        worker = self.worker
+        if worker is not None and threading.current_thread() is not worker.thread:
+            # The writes inside would queue behind this thread's hold on the card lock
+            raise RuntimeError("coalesce() in service mode must run on the card worker; use submit()")
+        with self._io_lock:
+            if self.do_out.pending is not None:
+                yield
+                return
+            self.do_out.begin()
+            self.opto_out.begin()
+            try:
+                yield
+            finally:
+                self.do_out.flush()
+                self.opto_out.flush()
+
+    def io_counters(self):
+        counters = {}
+        for kind, out in (("do", self.do_out), ("opto", self.opto_out)):
+            counters[f"{kind}_writes"] = out.writes
+            counters[f"{kind}_port_writes"] = out.port_writes
+            counters[f"{kind}_skipped"] = out.skipped
+            counters[f"{kind}_saved"] = out.skipped + out.coalesced
+        return counters
+
+    # ==========================================
+    # SERVICE MODE
+    # ==========================================
+    def start_service(self, maxsize=WORKER_QUEUE_DEPTH):
+        # From here the worker owns the card: public card calls from other threads are queued
+        # to it (see _on_worker). Timed pulse edges alone stay on the fire timer.
+        if self.worker is None:
+            self.worker = CardWorker(maxsize)
+            self.edges.dispatch = self._dispatch_timed
+
+    def stop_service(self):
+        worker, self.worker = self.worker, None
+        if worker is not None:
+            self.edges.dispatch = None
+            worker.stop()
+
+    def submit(self, fn, *args, priority=PRIO_OPERATOR):
+        # Queue a card command; runs inline when service mode is off
+        if self.worker is not None:
+            return self.worker.submit(fn, *args, priority=priority)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def poll(self, fn, *args):
+        return self.submit(fn, *args, priority=PRIO_POLL)
+
+    def _dispatch_timed(self, fn, *args):
+        worker = self.worker
+        if worker is None:
+            fn(*args)
+        else:
+            worker.submit(fn, *args, priority=PRIO_TIMED)
+
+    def _wait(self, future):
+        worker = self.worker
+        return worker.wait(future) if worker is not None else future.result()
+
+    def start_di_watch(self, rate=DI_WATCH_RATE):
+        if self.di_watch is None:
+            self.di_watch = DIWatcher(self, rate)
+            self.di_watch.start()
+        return self.di_watch
+
+    def stop_di_watch(self):
+        watch, self.di_watch = self.di_watch, None
+        if watch is not None:
+            watch.stop()
+
+    # ==========================================
+    # ANALOG SCAN
+    # ==========================================
+    def configure_ai_scan(self, names=AI_SCAN, samples=AI_SCAN_SAMPLES):
+        found, missing = {}, []
+        for name in names:
+            try:
+                found[name] = channelmap.resolve(name)
+            except KeyError:
+                missing.append(name)
+        if missing:
+            print("APCard: analog channels not in channel.py, not scanned:", ", ".join(missing))
+        self.ai_scan_names = tuple(found)
+        self.ai_scan_channels = list(found.values())
+        self._ai_buffer = np.empty((samples, len(self.ai_scan_channels)), dtype=np.float64)
+        # Compiled by the first check_limits(), so missing limits never stop a plain scan
+        self.limit_engine = None
+
+    @_on_worker
+    def scan_ai(self):
+        # Oversample the whole scan list into the preallocated buffer, then reduce per channel
+        if self.ai_scan_names is None:
+            self.configure_ai_scan()
+        buf = self._ai_buffer
+        read = self.card.ap_read_ai
+        chans = self.ai_scan_channels
+        with self._io_lock:
+            for row in buf:
+                for i, ch in enumerate(chans):
+                    row[i] = read(ch)
+        return AIScanResult(self.ai_scan_names, buf, time.monotonic())
+
+    def set_ai_limits(self, table):
+        # Every scanned channel needs an entry; the engine is recompiled on the next check
+        self.ai_limits = dict(table)
+        self.limit_engine = None
+
+    def check_limits(self, scan=None):
+        # One vectorized pass of the scan means against the compiled limit arrays
+        if scan is None:
+            scan = self.scan_ai()
+        elif self.ai_scan_names is None:
+            self.configure_ai_scan()
+        if self.limit_engine is None:
+            self.limit_engine = LimitEngine(self.ai_limits, self.ai_scan_names)
+        return self.limit_engine.evaluate(scan.mean, scan.timestamp)
+
+    # ==========================================
+    # LATCHING RELAY PULSE ENGINE
+    # ==========================================
+    def _relay_edges(self, relay, state):
+        # relay is a registry handle or a relay name
+        reg = self.registry
+        h = reg.handle(relay) if isinstance(relay, str) else relay
+        if state:
+            return h, reg.set_ch[h], reg.reset_ch[h]
+        return h, reg.reset_ch[h], reg.set_ch[h]
+
+    @_on_worker
+    def pulse_relay(self, relay, state):
+        h, on, off = self._relay_edges(relay, state)
+        name = self.registry.names[h]
+        status_ch = self.registry.status(h)
+        timeout = self.registry.timeout[h]
+        expected = 1 if state else 0
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            # Status before the set edge, so a relay already there is not timed as actuating
+            before = None if status_ch is None else self.ap_read_di(status_ch)
+            with self.coalesce():
+                self.ap_write_do(off, 0)
+                self.ap_write_do(on, 1)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        self.latched[name] = state
+        t0 = time.monotonic()
+        pulse = _RelayPulse(future, name, on, status_ch, expected, t0, t0 + PULSE_WIDTH + timeout)
+        self.edges.call_at(t0 + PULSE_WIDTH, self._pulse_release, pulse)
+        if before == expected:
+            pulse.actuated = True
+        elif status_ch is not None:
+            self.edges.call_at(t0 + STATUS_POLL_INTERVAL, self._pulse_poll, pulse)
+        return future
+
+    def relay_on(self, relay):
+        return self.pulse_relay(relay, True)
+
+    def relay_off(self, relay):
+        return self.pulse_relay(relay, False)
+
+    def _pulse_release(self, pulse):
+        try:
+            pulse.ret = self.ap_write_do(pulse.ch, 0)
+        except Exception as e:
+            if not pulse.future.done():
+                pulse.future.set_exception(e)
+            return
+        pulse.released = True
+        if pulse.status_ch is None:
+            pulse.future.set_result(pulse.ret)
+        elif pulse.actuated:
+            pulse.future.set_result(pulse.expected)
+        elif pulse.timed_out:
+            pulse.future.set_result(pulse.value)
+
+    def _pulse_poll(self, pulse):
+        # Status is watched from the set edge on, so the actuation time is the real
+        # relay latency; the future resolves once the pulse is released as well.
+        # Past the deadline the timeout is counted once and polling stops.
+        if pulse.future.done():
+            return
+        try:
+            value = self.ap_read_di(pulse.status_ch)
+        except Exception as e:
+            pulse.future.set_exception(e)
+            return
+        now = time.monotonic()
+        if value == pulse.expected:
+            pulse.actuated = True
+            self.actuation[pulse.name].add(now - pulse.t0)
+            if pulse.released:
+                pulse.future.set_result(value)
+        elif now >= pulse.deadline:
+            self.actuation[pulse.name].timeouts += 1
+            pulse.value = value
+            pulse.timed_out = True
+            if pulse.released:
+                pulse.future.set_result(value)
+        else:
+            self.edges.call_at(now + STATUS_POLL_INTERVAL, self._pulse_poll, pulse)
+
+    @_on_worker
+    def pulse_group(self, states, settle=0.0, force=False):
+        # Pulse independent relays in one shared window; result maps name -> status.
+        # force=True writes every edge even if the shadow says it is already there
+        # (another process may have driven the card), as the safety paths need.
+        drive = []
+        for relay, state in states:
+            h, on, off = self._relay_edges(relay, state)
+            drive.append((self.registry.names[h], on, off, self.registry.status(h), state))
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            with self.coalesce():
+                for _, _, off, _, _ in drive:
+                    self.ap_write_do(off, 0, force)
+                for _, on, _, _, _ in drive:
+                    self.ap_write_do(on, 1, force)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        for name, _, _, _, state in drive:
+            self.latched[name] = state
+        self.edges.call_later(PULSE_WIDTH, self._group_release, future, drive, settle, force)
+        return future
+
+    def _group_release(self, future, drive, settle, force=False):
+        try:
+            with self.coalesce():
+                for _, on, _, _, _ in drive:
+                    self.ap_write_do(on, 0, force)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self.edges.call_later(settle, self._group_verify, future, drive)
+
+    def _group_verify(self, future, drive):
+        try:
+            di = self.ap_read_di_all()
+            future.set_result({name: di[status_ch] for name, _, _, status_ch, _ in drive if status_ch is not None})
+        except Exception as e:
+            future.set_exception(e)
+
+    # ==========================================
+    # TIMED OUTPUT PULSES
+    # ==========================================
+    def timed_pulse(self, ch, duration):
+        # Hold ch high for duration seconds; the future gives the measured on-time.
+        # The release runs straight on the fire timer, never through the service queue.
+        # A channel already in a timed pulse is rejected: its release keeps the first deadline.
+        self._install_timed_guard()
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            with self._io_lock:
+                if ch in self._timed_active:
+                    raise RuntimeError(f"timed output {ch} is already pulsing")
+                self.do_out.write(ch, 1, True)
+                t_on = time.monotonic()
+                self._timed_active[ch] = future
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        self.fire_timer.call_at(t_on + duration, self._timed_release, ch, future, t_on)
+        return future
+
+    def _timed_release(self, ch, future, t_on):
+        with self._io_lock:
+            if self._timed_active.get(ch) is not future:
+                return
+            try:
+                self.do_out.write(ch, 0, True)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            finally:
+                del self._timed_active[ch]
+            future.set_result(time.monotonic() - t_on)
+
+    def release_all_timed(self):
+        # Force every timed output low now; pending releases become no-ops
+        with self._io_lock:
+            active, self._timed_active = self._timed_active, {}
+            for ch, future in active.items():
+                try:
+                    self.do_out.write(ch, 0, True)
+                finally:
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"timed output {ch} released early"))
+
+    def _install_timed_guard(self):
+        if self._timed_guard:
+            return
+        self._timed_guard = True
+        atexit.register(self.release_all_timed)
+        if threading.current_thread() is threading.main_thread():
+            previous = signal.getsignal(signal.SIGTERM)
+
+            def on_term(signum, frame):
+                self.release_all_timed()
+                if callable(previous):
+                    previous(signum, frame)
+                else:
+                    raise SystemExit(128 + signum)
+
+            signal.signal(signal.SIGTERM, on_term)
 
     # ==========================================
     # POWER SUBSYSTEM (manualpowerwindow)
     # ==========================================
+    # The *_on/*_off wrappers here and below are blocking compatibility shims for
+    # callers written against the old API: each waits out the pulse and its status
+    # (PULSE_WIDTH at least). Tk callbacks use relay_on/relay_off and poll the
+    # future from root.after instead.
     def sam_coil_on(self):
-        self.ap_write_do(channel.SAM_COIL_OFF, 0)
-        self.ap_write_do(channel.SAM_COIL_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.SAM_COIL_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.SAM_COIL_STATUS)
+        return self._wait(self.relay_on("SAM_COIL"))
 
     def sam_coil_off(self):
-        self.ap_write_do(channel.SAM_COIL_ON, 0)
-        self.ap_write_do(channel.SAM_COIL_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.SAM_COIL_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.SAM_COIL_STATUS)
+        return self._wait(self.relay_off("SAM_COIL"))
 
     def obp_on(self):
-        self.ap_write_do(channel.OBP_OFF, 0)
-        self.ap_write_do(channel.OBP_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.OBP_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.OBP_STATUS)
+        return self._wait(self.relay_on("OBP"))
 
     def obp_off(self):
-        self.ap_write_do(channel.OBP_ON, 0)
-        self.ap_write_do(channel.OBP_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.OBP_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.OBP_STATUS)
+        return self._wait(self.relay_off("OBP"))
 
     def tm_on(self):
-        self.ap_write_do(channel.TM_OFF, 0)
-        self.ap_write_do(channel.TM_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.TM_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.TM_STATUS)
+        return self._wait(self.relay_on("TM"))
 
     def tm_off(self):
-        self.ap_write_do(channel.TM_ON, 0)
-        self.ap_write_do(channel.TM_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.TM_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.TM_STATUS)
+        return self._wait(self.relay_off("TM"))
 
     def scu_on(self):
-        self.ap_write_do(channel.SCU_OFF, 0)
-        self.ap_write_do(channel.SCU_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.SCU_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.SCU_STATUS)
+        return self._wait(self.relay_on("SCU"))
 
     def scu_off(self):
-        self.ap_write_do(channel.SCU_ON, 0)
-        self.ap_write_do(channel.SCU_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.SCU_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.SCU_STATUS)
+        return self._wait(self.relay_off("SCU"))
 
     def cgu_on(self):
-        self.ap_write_do(channel.CGU_OFF, 0)
-        self.ap_write_do(channel.CGU_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.CGU_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.CGU_STATUS)
+        return self._wait(self.relay_on("CGU"))
 
     def cgu_off(self):
-        self.ap_write_do(channel.CGU_ON, 0)
-        self.ap_write_do(channel.CGU_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.CGU_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.CGU_STATUS)
+        return self._wait(self.relay_off("CGU"))
 
     def rpf_on(self):
-        self.ap_write_do(channel.RPF_OFF, 0)
-        self.ap_write_do(channel.RPF_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.RPF_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.RPF_STATUS)
+        return self._wait(self.relay_on("RPF"))
 
     def rpf_off(self):
-        self.ap_write_do(channel.RPF_ON, 0)
-        self.ap_write_do(channel.RPF_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.RPF_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.RPF_STATUS)
+        return self._wait(self.relay_off("RPF"))
 
     def ips_on(self):
-        self.ap_write_do(channel.IPS_OFF, 0)
-        self.ap_write_do(channel.IPS_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.IPS_ON, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.IPS_STATUS)
+        return self._wait(self.relay_on("IPS"))
 
     def ips_off(self):
-        self.ap_write_do(channel.IPS_ON, 0)
-        self.ap_write_do(channel.IPS_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.IPS_OFF, 0)
-        time.sleep(0.2)
-        return self.ap_read_di(channel.IPS_STATUS)
+        return self._wait(self.relay_off("IPS"))
 
     # ==========================================
     # PYRO SUBSYSTEM (manualpyrowindow)
     # ==========================================
     def pyro_ps_on(self):
-        self.ap_write_do(channel.PYRO_PS_OFF, 0)
-        self.ap_write_do(channel.PYRO_PS_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PYRO_PS_ON, 0)
-        time.sleep(0.5)
-        return self.ap_read_di(channel.PYRO_PS_STATUS)
+        return self._wait(self.relay_on("PYRO_PS"))
 
     def pyro_ps_off(self):
-        self.ap_write_do(channel.PYRO_PS_ON, 0)
-        self.ap_write_do(channel.PYRO_PS_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PYRO_PS_OFF, 0)
-        time.sleep(0.5)
-        return self.ap_read_di(channel.PYRO_PS_STATUS)
+        return self._wait(self.relay_off("PYRO_PS"))
 
+    @_on_worker
     def gnd_pyro_arm(self):
-        self.ap_write_do(channel.BOOSTER_GND_RELAY, 1)
-        self.ap_write_do(channel.THAB_GND_RELAY, 1)
+        with self.coalesce():
+            for ch in self._gnd_relays:
+                self.ap_write_do(ch, 1)
 
+    @_on_worker
     def gnd_pyro_safe(self):
-        self.ap_write_do(channel.BOOSTER_GND_RELAY, 0)
-        self.ap_write_do(channel.THAB_GND_RELAY, 0)
+        # Safety path: always written, whatever the shadow says
+        with self.coalesce():
+            for ch in self._gnd_relays:
+                self.ap_write_do(ch, 0, force=True)
 
     def ne_pyro_arm(self):
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_SAFE, 0)
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_ARM, 1)
-        time.sleep(0.1)
-        return self.ap_write_do(channel.NOZZLE_PYRO_RELAY_ARM, 0)
+        return self._wait(self.relay_on("NE_PYRO"))
 
     def ne_pyro_safe(self):
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_ARM, 0)
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_SAFE, 1)
-        time.sleep(0.1)
-        return self.ap_write_do(channel.NOZZLE_PYRO_RELAY_SAFE, 0)
+        return self._wait(self.relay_off("NE_PYRO"))
 
     def booster_fire(self):
-        self.ap_write_do(channel.BOOSTER_FIRE, 1)
-        time.sleep(5.0)
-        self.ap_write_do(channel.BOOSTER_FIRE, 0)
+        return self.timed_pulse(self._fire["BOOSTER_FIRE"], FIRE_DURATION)
 
     def thbatt_fire(self):
-        self.ap_write_do(channel.THBATTERY_FIRE, 1)
-        time.sleep(5.0)
-        self.ap_write_do(channel.THBATTERY_FIRE, 0)
+        return self.timed_pulse(self._fire["THBATTERY_FIRE"], FIRE_DURATION)
 
     def airbottle_fire(self):
-        self.ap_write_do(channel.AIRBOTTLE_FIRE, 1)
-        time.sleep(5.0)
-        self.ap_write_do(channel.AIRBOTTLE_FIRE, 0)
+        return self.timed_pulse(self._fire["AIRBOTTLE_FIRE"], FIRE_DURATION)
 
     def pr_switch_close(self):
-        self.ap_write_do(channel.PR_SWITCH_OFF, 0)
-        self.ap_write_do(channel.PR_SWITCH_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PR_SWITCH_ON, 0)
-        return self.ap_read_di(channel.PR_SWITCH_STATUS)
+        return self._wait(self.relay_on("PR_SWITCH"))
 
     def pr_switch_open(self):
-        self.ap_write_do(channel.PR_SWITCH_ON, 0)
-        self.ap_write_do(channel.PR_SWITCH_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PR_SWITCH_OFF, 0)
-        return self.ap_read_di(channel.PR_SWITCH_STATUS)
-
-    def all_safe(self):
-        self.ap_write_do(channel.BOOSTER_GND_RELAY, 0)
-        self.ap_write_do(channel.THAB_GND_RELAY, 0)
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_ARM, 0)
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_SAFE, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.NOZZLE_PYRO_RELAY_SAFE, 0)
-        self.ap_write_do(channel.PYRO_PS_ON, 0)
-        self.ap_write_do(channel.PYRO_PS_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PYRO_PS_OFF, 0)
-        self.ap_write_do(channel.IPS_ON, 0)
-        self.ap_write_do(channel.IPS_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.IPS_OFF, 0)
-        self.ap_write_do(channel.PR_SWITCH_ON, 0)
-        self.ap_write_do(channel.PR_SWITCH_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.PR_SWITCH_OFF, 0)
+        return self._wait(self.relay_off("PR_SWITCH"))
+
+    @_on_worker
+    def all_safe(self, parallel=True):
+        start = time.perf_counter()
+        self.release_all_timed()
+        self.gnd_pyro_safe()
+        if parallel:
+            status = self._wait(self.pulse_group([(h, False) for h in self._all_safe], force=True))
+        else:
+            status = {}
+            for h in self._all_safe:
+                status.update(self._wait(self.pulse_group([(h, False)], force=True)))
+        self.last_all_safe_ms = (time.perf_counter() - start) * 1000
+        return status
 
     # ==========================================
     # CGU / OPTO SUBSYSTEM (manualcguwindow)
     # ==========================================
     def cgu_fin1_on(self):
-        self.ap_write_opto_do(channel.CGUTX3, 1)
-        self.ap_write_opto_do(channel.CGUTX1, 0)
-        self.ap_write_opto_do(channel.CGURX3, 1)
-        self.ap_write_opto_do(channel.CGURX1, 0)
+        self.ap_update_opto_lines(high=self._cgu_fin3, low=self._cgu_fin1)
 
     def cgu_fin3_on(self):
-        self.ap_write_opto_do(channel.CGUTX1, 1)
-        self.ap_write_opto_do(channel.CGUTX3, 0)
-        self.ap_write_opto_do(channel.CGURX1, 1)
-        self.ap_write_opto_do(channel.CGURX3, 0)
+        self.ap_update_opto_lines(high=self._cgu_fin1, low=self._cgu_fin3)
 
     # ==========================================
     # RPF SUBSYSTEM (manualrpfwindow)
     # ==========================================
+    @_on_worker
     def set_delay_opto(self, delay_ch):
-        for p in range(8):
-            self.ap_write_opto_do(p, 1)
-        time.sleep(0.1)
-        self.ap_write_opto_do(delay_ch, 0)
+        # Break before make: release every delay line, then pull the selected one low
+        target = 0xFF & ~(1 << delay_ch)
+        current = self.opto_out.port_value(0)
+        if current == target:
+            return
+        if current != 0xFF:
+            self.ap_write_opto_port(0xFF)
+            time.sleep(0.1)
+        self.ap_write_opto_port(target)
 
     def rpf_tx1_on(self):
-        self.ap_write_opto_do(channel.RPFTX2, 1)
-        self.ap_write_opto_do(channel.RPFTX1, 0)
+        self.ap_update_opto_lines(high=self._rpf_tx[1:], low=self._rpf_tx[:1])
 
     def rpf_tx2_on(self):
-        self.ap_write_opto_do(channel.RPFTX1, 1)
-        self.ap_write_opto_do(channel.RPFTX2, 0)
+        self.ap_update_opto_lines(high=self._rpf_tx[:1], low=self._rpf_tx[1:])
+
+    def attenuation(self):
+        # Net dB from the last commanded pad states, None until every pad has been pulsed
+        states = [self.latched.get(name) for name, _ in ATTENUATOR_PADS]
+        if None in states:
+            return None
+        return sum(db for (_, db), on in zip(ATTENUATOR_PADS, states) if on)
+
+    def solve_attenuation(self, target_db):
+        # Pad mask reaching target_db with the fewest relays to pulse; unknown pads always count
+        best = None
+        for mask, db in ATTENUATOR_COMBOS:
+            if db != target_db:
+                continue
+            changes = []
+            for i, h in enumerate(self._atten_pads):
+                on = bool(mask >> i & 1)
+                if self.latched.get(self.registry.names[h]) != on:
+                    changes.append((h, on))
+            if best is None or len(changes) < len(best):
+                best = changes
+        if best is None:
+            raise ValueError(f"attenuation {target_db} dB not reachable with the RPF pads")
+        return best
+
+    def set_attenuation(self, target_db):
+        changes = self.solve_attenuation(target_db)
+        if changes:
+            self._wait(self.pulse_group(changes))
+        return self.attenuation()
 
+    @_on_worker
     def g_switch_on(self):
-        self.ap_write_do(channel.G_SWITCH_CLOSE, 1)
+        self.ap_write_do(self._g_switch, 1)
 
+    @_on_worker
     def g_switch_off(self):
-        self.ap_write_do(channel.G_SWITCH_CLOSE, 0)
+        self.ap_write_do(self._g_switch, 0)
 
     def k8_relay_on(self):
-        self.ap_write_do(channel.K8OFF, 0)
-        self.ap_write_do(channel.K8ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.K8ON, 0)
+        self._wait(self.relay_on("K8"))
 
     def k8_relay_off(self):
-        self.ap_write_do(channel.K8ON, 0)
-        self.ap_write_do(channel.K8OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.K8OFF, 0)
+        self._wait(self.relay_off("K8"))
 
     # RPF Attenuators
     def atten_1db_on(self):
-        self.ap_write_do(channel.A1DB_OFF, 0)
-        self.ap_write_do(channel.A1DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A1DB_ON, 0)
+        self._wait(self.relay_on("A1DB"))
 
     def atten_1db_off(self):
-        self.ap_write_do(channel.A1DB_ON, 0)
-        self.ap_write_do(channel.A1DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A1DB_OFF, 0)
+        self._wait(self.relay_off("A1DB"))
 
     def atten_2db_on(self):
-        self.ap_write_do(channel.A2DB_OFF, 0)
-        self.ap_write_do(channel.A2DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A2DB_ON, 0)
+        self._wait(self.relay_on("A2DB"))
 
     def atten_2db_off(self):
-        self.ap_write_do(channel.A2DB_ON, 0)
-        self.ap_write_do(channel.A2DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A2DB_OFF, 0)
+        self._wait(self.relay_off("A2DB"))
 
     def atten_4db_on(self):
-        self.ap_write_do(channel.A4DB_OFF, 0)
-        self.ap_write_do(channel.A4DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A4DB_ON, 0)
+        self._wait(self.relay_on("A4DB"))
 
     def atten_4db_off(self):
-        self.ap_write_do(channel.A4DB_ON, 0)
-        self.ap_write_do(channel.A4DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A4DB_OFF, 0)
+        self._wait(self.relay_off("A4DB"))
 
     def atten_4db1_on(self):
-        self.ap_write_do(channel.A4DB1_OFF, 0)
-        self.ap_write_do(channel.A4DB1_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A4DB1_ON, 0)
+        self._wait(self.relay_on("A4DB1"))
 
     def atten_4db1_off(self):
-        self.ap_write_do(channel.A4DB1_ON, 0)
-        self.ap_write_do(channel.A4DB1_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A4DB1_OFF, 0)
+        self._wait(self.relay_off("A4DB1"))
 
     def atten_10db_on(self):
-        self.ap_write_do(channel.A10DB_OFF, 0)
-        self.ap_write_do(channel.A10DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A10DB_ON, 0)
+        self._wait(self.relay_on("A10DB"))
 
     def atten_10db_off(self):
-        self.ap_write_do(channel.A10DB_ON, 0)
-        self.ap_write_do(channel.A10DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A10DB_OFF, 0)
+        self._wait(self.relay_off("A10DB"))
 
     def atten_20db_on(self):
-        self.ap_write_do(channel.A20DB_OFF, 0)
-        self.ap_write_do(channel.A20DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A20DB_ON, 0)
+        self._wait(self.relay_on("A20DB"))
 
     def atten_20db_off(self):
-        self.ap_write_do(channel.A20DB_ON, 0)
-        self.ap_write_do(channel.A20DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A20DB_OFF, 0)
+        self._wait(self.relay_off("A20DB"))
 
     def atten_30db_on(self):
-        self.ap_write_do(channel.A30DB_OFF, 0)
-        self.ap_write_do(channel.A30DB_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A30DB_ON, 0)
+        self._wait(self.relay_on("A30DB"))
 
     def atten_30db_off(self):
-        self.ap_write_do(channel.A30DB_ON, 0)
-        self.ap_write_do(channel.A30DB_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A30DB_OFF, 0)
+        self._wait(self.relay_off("A30DB"))
 
     def atten_30db1_on(self):
-        self.ap_write_do(channel.A30DB1_OFF, 0)
-        self.ap_write_do(channel.A30DB1_ON, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A30DB1_ON, 0)
+        self._wait(self.relay_on("A30DB1"))
 
     def atten_30db1_off(self):
-        self.ap_write_do(channel.A30DB1_ON, 0)
-        self.ap_write_do(channel.A30DB1_OFF, 1)
-        time.sleep(0.1)
-        self.ap_write_do(channel.A30DB1_OFF, 0)
+        self._wait(self.relay_off("A30DB1"))
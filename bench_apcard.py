@@ -0,0 +1,53 @@
+import time
+import channel
+from apcardmanager import APCardManager, DI_CHANNELS
+from simcard import SimulatedCard, CALL_LATENCY
+
+POLLED_STATUS = [
+    "UMB1_STATUS", "UMB2_STATUS", "SAM_COIL_STATUS", "OBP_STATUS",
+    "TM_STATUS", "SCU_STATUS", "CGU_STATUS", "RPF_STATUS",
+    "IPS_STATUS", "PYRO_PS_STATUS", "PR_SWITCH_STATUS", "G_SWITCH_STATUS",
+    "K1_STATUS", "K2_STATUS", "K3_STATUS", "K4_STATUS",
+    "K5_STATUS", "K6_STATUS", "K7_STATUS",
+]
+
+
+def snapshot_cycle(api, names, channels=None):
+    di = api.read_di_snapshot(channels)
+    return [di[n] for n in names]
+
+
+def run(label, fn, card, loops):
+    card.calls = 0
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / loops * 1e6:9.1f} us/cycle  {card.calls / loops:5.1f} calls/cycle")
+
+
+def main(loops=2000):
+    names = [n for n in POLLED_STATUS if hasattr(channel, n)]
+    chans = [getattr(channel, n) for n in names]
+    print(f"{len(names)} status channels, {DI_CHANNELS} DI lines, {CALL_LATENCY * 1e6:.0f} us per call")
+
+    card = SimulatedCard()
+    api = APCardManager(card=card)
+    run("per-channel ap_read_di", lambda: [api.ap_read_di(c) for c in chans], card, loops)
+    run("ap_read_di_all (port read)", lambda: snapshot_cycle(api, names), card, loops)
+
+    card = SimulatedCard(port_io=False)
+    api = APCardManager(card=card)
+    run("ap_read_di_all (emulated)", lambda: snapshot_cycle(api, names), card, loops)
+    run("read_di_snapshot (emulated)", lambda: snapshot_cycle(api, names, names), card, loops)
+
+    api = APCardManager(card=SimulatedCard())
+    for label, fn in [("sam_coil_on", api.sam_coil_on), ("pyro_ps_on", api.pyro_ps_on),
+                      ("all_safe", api.all_safe), ("scan_ai", api.scan_ai)]:
+        start = time.perf_counter()
+        fn()
+        print(f"{label:<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
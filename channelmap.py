@@ -0,0 +1,148 @@
+from array import array
+import channel
+
+# Every latching relay on the AP card:
+# name, set DO, reset DO, status DI (or None), status timeout after release, kind
+RELAY_TABLE = (
+    ("SAM_COIL", "SAM_COIL_ON", "SAM_COIL_OFF", "SAM_COIL_STATUS", 0.2, "power"),
+    ("OBP", "OBP_ON", "OBP_OFF", "OBP_STATUS", 0.2, "power"),
+    ("TM", "TM_ON", "TM_OFF", "TM_STATUS", 0.2, "power"),
+    ("SCU", "SCU_ON", "SCU_OFF", "SCU_STATUS", 0.2, "power"),
+    ("CGU", "CGU_ON", "CGU_OFF", "CGU_STATUS", 0.2, "power"),
+    ("RPF", "RPF_ON", "RPF_OFF", "RPF_STATUS", 0.2, "power"),
+    ("IPS", "IPS_ON", "IPS_OFF", "IPS_STATUS", 0.2, "power"),
+    ("PYRO_PS", "PYRO_PS_ON", "PYRO_PS_OFF", "PYRO_PS_STATUS", 0.5, "pyro"),
+    ("NE_PYRO", "NOZZLE_PYRO_RELAY_ARM", "NOZZLE_PYRO_RELAY_SAFE", None, 0.0, "pyro"),
+    ("PR_SWITCH", "PR_SWITCH_ON", "PR_SWITCH_OFF", "PR_SWITCH_STATUS", 0.0, "pyro"),
+    ("K8", "K8ON", "K8OFF", None, 0.0, "rpf"),
+    ("A1DB", "A1DB_ON", "A1DB_OFF", None, 0.0, "atten"),
+    ("A2DB", "A2DB_ON", "A2DB_OFF", None, 0.0, "atten"),
+    ("A4DB", "A4DB_ON", "A4DB_OFF", None, 0.0, "atten"),
+    ("A4DB1", "A4DB1_ON", "A4DB1_OFF", None, 0.0, "atten"),
+    ("A10DB", "A10DB_ON", "A10DB_OFF", None, 0.0, "atten"),
+    ("A20DB", "A20DB_ON", "A20DB_OFF", None, 0.0, "atten"),
+    ("A30DB", "A30DB_ON", "A30DB_OFF", None, 0.0, "atten"),
+    ("A30DB1", "A30DB1_ON", "A30DB1_OFF", None, 0.0, "atten"),
+)
+
+# Plain DO lines driven by name (no set/reset pair)
+DO_OUTPUTS = (
+    "BOOSTER_GND_RELAY", "THAB_GND_RELAY",
+    "BOOSTER_FIRE", "THBATTERY_FIRE", "AIRBOTTLE_FIRE",
+    "G_SWITCH_CLOSE",
+)
+# Opto lines driven by name
+OPTO_OUTPUTS = ("RPFTX1", "RPFTX2", "CGUTX1", "CGUTX3", "CGURX1", "CGURX3")
+# DI status lines read by name, besides the relay status lines in RELAY_TABLE
+DI_INPUTS = (
+    "UMB1_STATUS", "UMB2_STATUS", "G_SWITCH_STATUS",
+    "K1_STATUS", "K2_STATUS", "K3_STATUS", "K4_STATUS", "K5_STATUS", "K6_STATUS", "K7_STATUS",
+)
+
+NO_CHANNEL = -1
+
+
+def resolve(name, module=channel):
+    # Strict channel lookup: a typo is an error, never channel 0
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise KeyError(f"channel.{name} is not defined") from None
+
+
+class ChannelRegistry:
+    # RELAY_TABLE compiled once into flat arrays, a handle is the row index; plain
+    # outputs and status inputs compiled into name -> channel maps alongside
+    def __init__(self, table=RELAY_TABLE, module=channel, outputs=DO_OUTPUTS, opto=OPTO_OUTPUTS, inputs=DI_INPUTS):
+        self.names = tuple(row[0] for row in table)
+        self.handles = {name: h for h, name in enumerate(self.names)}
+        if len(self.handles) != len(self.names):
+            raise ValueError("duplicate relay name in channel table")
+        self.set_ch = array("i")
+        self.reset_ch = array("i")
+        self.status_ch = array("i")
+        self.timeout = array("d")
+        self.kind = tuple(row[5] for row in table)
+        missing = []
+        for name, set_name, reset_name, status_name, timeout, _ in table:
+            chans = []
+            for ch_name in (set_name, reset_name, status_name):
+                if ch_name is None:
+                    chans.append(NO_CHANNEL)
+                    continue
+                try:
+                    chans.append(resolve(ch_name, module))
+                except KeyError:
+                    missing.append(f"{name}: channel.{ch_name}")
+                    chans.append(NO_CHANNEL)
+            self.set_ch.append(chans[0])
+            self.reset_ch.append(chans[1])
+            self.status_ch.append(chans[2])
+            self.timeout.append(timeout)
+        status_names = [row[3] for row in table if row[3] is not None]
+        self.outputs = self._compile(outputs, module, missing)
+        self.opto = self._compile(opto, module, missing)
+        self.inputs = self._compile(status_names + [n for n in inputs if n not in status_names], module, missing)
+        if missing:
+            raise KeyError("undefined channels: " + ", ".join(missing))
+
+    @staticmethod
+    def _compile(names, module, missing):
+        chans = {}
+        for name in names:
+            try:
+                chans[name] = resolve(name, module)
+            except KeyError:
+                missing.append(f"channel.{name}")
+        return chans
+
+    def __len__(self):
+        return len(self.names)
+
+    def handle(self, name):
+        try:
+            return self.handles[name]
+        except KeyError:
+            raise KeyError(f"unknown relay {name!r}") from None
+
+    def handles_of(self, names):
+        return tuple(self.handle(name) for name in names)
+
+    def output(self, name):
+        try:
+            return self.outputs[name]
+        except KeyError:
+            raise KeyError(f"unknown DO output {name!r}") from None
+
+    def opto_line(self, name):
+        try:
+            return self.opto[name]
+        except KeyError:
+            raise KeyError(f"unknown opto output {name!r}") from None
+
+    def input(self, name):
+        try:
+            return self.inputs[name]
+        except KeyError:
+            raise KeyError(f"unknown DI status {name!r}") from None
+
+    def inputs_of(self, names):
+        # Resolve a window's status list once, at startup
+        return tuple(self.input(name) for name in names)
+
+    def of_kind(self, kind):
+        return tuple(h for h, k in enumerate(self.kind) if k == kind)
+
+    def status(self, h):
+        ch = self.status_ch[h]
+        return None if ch == NO_CHANNEL else ch
+
+
+_registry = None
+
+
+def load():
+    global _registry
+    if _registry is None:
+        _registry = ChannelRegistry()
+    return _registry
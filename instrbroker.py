@@ -0,0 +1,317 @@
+import fcntl
+import os
+import pickle
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+# One long-lived process owns the VISA sessions; every window talks to it
+# through InstrProxy, which exposes the instrumentManager.instr method names.
+# The socket lives in a per-user directory next to a 0600 file holding the authkey
+# the broker generates at start, and a lock file the broker holds while it runs;
+# INSTR_BROKER overrides the socket path.
+BROKER_SOCKET = "mtb-instr.sock"
+CONNECT_TIMEOUT = 10.0
+# The application ends the broker on exit (verify.py EXIT, shutdown()). As a fallback the
+# broker closes the instruments (supplies off) once no window has been connected for this
+# long; it has to outlast an operator sitting on a screen without instruments. 0 disables it.
+IDLE_SHUTDOWN = float(os.environ.get("INSTR_BROKER_IDLE", "1800"))
+
+# init method -> the session it (re)configures; initAwgCont and initAwgTrig share the AWG
+INIT_RESOURCES = {
+    "initAwgCont": "awg",
+    "initAwgTrig": "awg",
+    "initPowm": "powm",
+    "initSig": "sig",
+    "initOsc": "osc",
+    "initFreqCounter": "fc",
+    "initExtPs": "extps",
+    "initStsPs": "stsps",
+    "initTxPS": "txps",
+}
+GPIB_INITS = ("initAwgCont", "initPowm", "initSig", "initOsc", "initFreqCounter", "initExtPs", "initStsPs", "initTxPS")
+
+
+def runtime_dir():
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base and os.path.isdir(base):
+        return base
+    path = os.path.join(tempfile.gettempdir(), f"mtb-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory")
+    return path
+
+
+def broker_address():
+    return os.environ.get("INSTR_BROKER") or os.path.join(runtime_dir(), BROKER_SOCKET)
+
+
+def key_path(address):
+    return address + ".key"
+
+
+def lock_path(address):
+    return address + ".lock"
+
+
+def read_key(address):
+    with open(key_path(address), "rb") as f:
+        return f.read()
+
+
+def _client(address, key=None):
+    return Client(address, family="AF_UNIX", authkey=key if key is not None else read_key(address))
+
+
+class InstrBroker:
+    def __init__(self, address=None, instrument=None, idle_shutdown=IDLE_SHUTDOWN):
+        self.address = address or broker_address()
+        self.authkey = None
+        self.idle_shutdown = idle_shutdown
+        self.clients = 0
+        self.idle_timer = None
+        self.instrument = instrument
+        self.lock = threading.Lock()
+        # Session -> the init method last applied to it successfully; repeating that
+        # same init would only *RST the instrument again
+        self.inited = {}
+        self.running = False
+        self.listener = None
+        self.lock_fd = None
+
+    def serve_forever(self):
+        # The lock decides which broker owns the address; the socket and key files left
+        # by a broker that died are only removed while holding it
+        fd = os.open(lock_path(self.address), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            print("instr: broker already running on", self.address)
+            return
+        self.lock_fd = fd
+        try:
+            for path in (self.address, key_path(self.address)):
+                if os.path.exists(path):
+                    os.unlink(path)
+            self.authkey = os.urandom(32)
+            # Bind first, then publish the key; clients retry until it is there
+            self.listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+            fd = os.open(key_path(self.address), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.authkey)
+            if self.instrument is None:
+                import instrumentManager
+                self.instrument = instrumentManager.instr()
+        except BaseException:
+            self.close()
+            raise
+        self.running = True
+        print("instr: broker listening on", self.address)
+        self._client_gone()
+        try:
+            while self.running:
+                try:
+                    conn = self.listener.accept()
+                except (AuthenticationError, EOFError, ConnectionError):
+                    # A peer without the key, or one that hung up during the handshake
+                    continue
+                except OSError:
+                    break
+                if not self.running:
+                    conn.close()
+                    break
+                with self.lock:
+                    self.clients += 1
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def stop(self):
+        # Clear running and wake the accept loop so it sees it
+        self.running = False
+        try:
+            _client(self.address, self.authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass
+
+    def _client_gone(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        if not self.idle_shutdown:
+            return
+        self.idle_timer = threading.Timer(self.idle_shutdown, self._idle_check)
+        self.idle_timer.daemon = True
+        self.idle_timer.start()
+
+    def _idle_check(self):
+        with self.lock:
+            idle = self.clients == 0
+        if idle and self.running:
+            print("instr: no clients left, broker shutting down")
+            self.stop()
+
+    def close(self):
+        self.running = False
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        if self.lock_fd is None:
+            return
+        for path in (self.address, key_path(self.address)):
+            if os.path.exists(path):
+                os.unlink(path)
+        if self.instrument is not None:
+            self.instrument.close()
+            self.instrument = None
+        os.close(self.lock_fd)
+        self.lock_fd = None
+
+    def _serve(self, conn):
+        try:
+            with conn:
+                while True:
+                    try:
+                        name, args, kwargs = conn.recv()
+                    except (EOFError, OSError):
+                        return
+                    conn.send(self._call(name, args, kwargs))
+                    if name == "_shutdown":
+                        self.stop()
+                        return
+        finally:
+            with self.lock:
+                self.clients -= 1
+                idle = self.clients == 0
+            if idle:
+                self._client_gone()
+
+    def _call(self, name, args, kwargs):
+        with self.lock:
+            try:
+                if name == "_shutdown":
+                    return ("ok", None)
+                if name == "_reset":
+                    self.inited.clear()
+                    return ("ok", None)
+                if name == "_methods":
+                    return ("ok", [n for n in dir(self.instrument) if not n.startswith("_") and callable(getattr(self.instrument, n))])
+                if name == "_getattr":
+                    value = getattr(self.instrument, args[0])
+                    try:
+                        pickle.dumps(value)
+                    except Exception:
+                        raise AttributeError(f"instr.{args[0]} is owned by the broker and cannot be sent; use the instr methods") from None
+                    return ("ok", value)
+                if name in INIT_RESOURCES and self.inited.get(INIT_RESOURCES[name]) == name and not args and not kwargs:
+                    return ("ok", 0)
+                if name == "initGpib" and all(self.inited.get(INIT_RESOURCES[n]) == n for n in GPIB_INITS):
+                    return ("ok", 0)
+                attr = getattr(self.instrument, name)
+                if not callable(attr):
+                    raise TypeError(f"instr.{name} is not a method")
+                if name in INIT_RESOURCES:
+                    # Whatever happens, the session no longer holds the previous setup
+                    self.inited.pop(INIT_RESOURCES[name], None)
+                ret = attr(*args, **kwargs)
+                if ret == 0 and name in INIT_RESOURCES:
+                    self.inited[INIT_RESOURCES[name]] = name
+                elif ret == 0 and name == "initGpib":
+                    self.inited.update((INIT_RESOURCES[n], n) for n in GPIB_INITS)
+                return ("ok", ret)
+            except SystemExit as e:
+                # displayGpibError quits the program: quit the client, not the broker
+                return ("exit", e.code)
+            except Exception as e:
+                return ("err", e)
+
+
+class InstrProxy:
+    def __init__(self, address=None):
+        self._conn = _client(address or broker_address())
+        self._lock = threading.Lock()
+        self._methods = frozenset(self._call("_methods"))
+
+    def _call(self, name, args=(), kwargs=None):
+        with self._lock:
+            self._conn.send((name, args, kwargs or {}))
+            status, value = self._conn.recv()
+        if status == "err":
+            raise value
+        if status == "exit":
+            sys.exit(value)
+        return value
+
+    def __getattr__(self, name):
+        # instr methods become remote calls; any other attribute is fetched by value
+        # on every access (e.g. init_times). VISA sessions such as .osc stay in the broker.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._methods:
+            return self._call("_getattr", (name,))
+
+        def call(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        call.__name__ = name
+        return call
+
+    def reset(self):
+        # Forget completed inits so the next init* call really re-initialises
+        self._call("_reset")
+
+    def shutdown_broker(self):
+        self._call("_shutdown")
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(address=None, spawn=True, timeout=CONNECT_TIMEOUT):
+    # Attach to the running broker, starting one in the background if there is none
+    address = address or broker_address()
+    try:
+        return InstrProxy(address)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not spawn:
+            raise
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), address], start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        time.sleep(0.05)
+        try:
+            return InstrProxy(address)
+        except (FileNotFoundError, ConnectionRefusedError, AuthenticationError):
+            if time.monotonic() > deadline:
+                raise
+
+
+def shutdown(address=None):
+    # Application exit: close the instruments now if a broker is running
+    try:
+        proxy = InstrProxy(address)
+    except (FileNotFoundError, ConnectionRefusedError, AuthenticationError):
+        return False
+    proxy.shutdown_broker()
+    return True
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+if __name__ == "__main__":
+    # A kill or a closed terminal still goes through close(), which turns the supplies off
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGHUP, _terminate)
+    InstrBroker(sys.argv[1] if len(sys.argv) > 1 else None).serve_forever()
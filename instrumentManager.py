@@ -1,6 +1,11 @@
+import hashlib
+import os
 import time
 import sys
 import pyvisa
+from concurrent.futures import ThreadPoolExecutor
+from visatrace import RecordingResourceManager, ReplayResourceManager
+from waveform import Waveform, analysePulse, analyseSegments, inWidth, pulseStatistics
 
 TDK_LAMBDA = 1
 powerSupplyType = TDK_LAMBDA
@@ -16,12 +21,192 @@ STS_PS_IP = "192.168.1.4"
 TX_PS_IP = "192.168.1.5" 
 
 PRECISION = 0.00001
+# Longest program message sent in one write; a batch longer than this is split
+MAX_PROGRAM_MESSAGE = 1024
+# Upper bound on SYST:ERR? reads when draining the error queue after a batch
+MAX_ERROR_READS = 20
+
+# Operation-complete wait: "opc_query" blocks on *OPC?, "srq" waits for a service
+# request, "poll" reads *ESR? with a doubling interval
+OPC_STRATEGY = "opc_query"
+OPC_TIMEOUT_MS = 10000
+OPC_POLL_MIN = 0.001
+OPC_POLL_MAX = 0.05
+
+# Oscilloscope settings tracked by the profile cache, in the order they are sent
+# (the trigger source goes before the level, which is kept per source)
+OSC_STATE_KEYS = tuple(
+    f"CHAN{ch}:{item}" for ch in (1, 2, 3, 4) for item in ("DISP", "IMP", "PROB", "COUP", "SCAL", "OFFS")
+) + (
+    "ACQ:MODE", "TIM:REF", "TIM:SCAL", "TIM:MODE",
+    "TRIG:SWE", "TRIG:MODE", "TRIG:TV:SOUR", "TRIG:EDGE:SOUR", "TRIG:EDGE:SLOP", "TRIG:LEV",
+)
+
+# Common to every profile; replaces the old ":BLANK"
+OSC_DEFAULTS = {
+    "CHAN1:DISP": "0",
+    "CHAN2:DISP": "0",
+    "CHAN3:DISP": "0",
+    "CHAN4:DISP": "0",
+}
+
+# Settings layered on the state after *RST; anything not listed keeps its reset value
+OSC_CGU_CAPTURE = {
+    "CHAN1:IMP": "FIFT",
+    "TRIG:MODE": "EDGE",
+    "TRIG:EDGE:SOUR": "CHAN1",
+    "TRIG:LEV": "-500mV",
+    "TRIG:EDGE:SLOP": "NEG",
+    "TRIG:SWE": "NORM",
+}
+
+OSC_CGU_PULSE = {
+    "TRIG:TV:SOUR": "CHAN1",
+    "TRIG:SWE": "NORM",
+    "TRIG:MODE": "EDGE",
+    "TRIG:EDGE:SLOP": "NEG",
+    "TRIG:LEV": "-100mV",
+}
+
+OSC_CGU = {
+    **OSC_DEFAULTS,
+    "CHAN1:DISP": "1",
+    "CHAN1:IMP": "FIFT",
+    "CHAN1:PROB": "1",
+    "CHAN1:COUP": "DC",
+    "CHAN1:SCAL": "300mV",
+    "CHAN1:OFFS": "-900mV",
+    "TIM:REF": "CENT",
+    "TIM:SCAL": "2E-7",
+    "TIM:MODE": "MAIN",
+}
+
+
+def _oscCont(ch):
+    return {**OSC_DEFAULTS, f"CHAN{ch}:DISP": "1", "TIM:SCAL": "50E-3", f"CHAN{ch}:SCAL": "5V"}
+
+
+def _oscPulse(*channels):
+    # Firing pulse on each fin channel, triggered from the first
+    return {
+        **OSC_DEFAULTS,
+        **{f"CHAN{ch}:DISP": "1" for ch in channels},
+        "TIM:SCAL": "5E-2",
+        "TRIG:SWE": "NORM",
+        "TRIG:MODE": "EDGE",
+        "TRIG:EDGE:SOUR": f"CHAN{channels[0]}",
+        "TRIG:EDGE:SLOP": "POS",
+        "TRIG:LEV": "8.63V",
+    }
+
+
+# Single acquisition: time allowed to arm and capture, then per sensitivity retry
+OSC_ACQ_TIMEOUT_MS = 2000
+OSC_RETRY_MS = 300
+
+# Segmented multi-shot capture: pulses per arm, and the time allowed to collect them
+OSC_SEGMENTS = 16
+OSC_SEGMENT_TIMEOUT_MS = 5000
+
+# A CGU pulse counts only with a 50 % width inside this window (s); anything else is noise
+CGU_WIDTH_MIN = 2e-7
+CGU_WIDTH_MAX = 4e-7
+
+# Points requested per waveform transfer; the scope clamps it to what the record holds
+WAV_POINTS = 10000
+
+OSC_PROFILES = {
+    "cgu": OSC_CGU,
+    "cgu_capture": {**OSC_CGU, **OSC_CGU_CAPTURE},
+    "cgu_segmented": {**OSC_CGU, **OSC_CGU_CAPTURE, "ACQ:MODE": "SEGM"},
+    "cont_left": _oscCont(2),
+    "cont_right": _oscCont(3),
+    "pulse_left": _oscPulse(2),
+    "pulse_right": _oscPulse(3),
+    "pulse_both": _oscPulse(2, 3),
+}
+
+# Fin channels -> firing pulse profile
+OSC_PULSE_PROFILES = {
+    (2,): "pulse_left",
+    (3,): "pulse_right",
+    (2, 3): "pulse_both",
+}
+
+FIRING_PULSE_TIMEOUT_MS = 5000
 FMAX = 5.7e9
 FMIN = 5.6e9
 
+def openResourceManager():
+    # INSTR_REPLAY=<file> serves a recorded session, INSTR_RECORD=<file> records this one
+    replay = os.environ.get("INSTR_REPLAY")
+    if replay:
+        return ReplayResourceManager(replay, realtime=os.environ.get("INSTR_REPLAY_REALTIME") == "1")
+    rm = pyvisa.ResourceManager()
+    record = os.environ.get("INSTR_RECORD")
+    if record:
+        return RecordingResourceManager(rm, record)
+    return rm
+
+class SCPIBatch:
+    # Stands in for a session inside "with inst.batch(session) as s:". Writes are
+    # queued and sent as ";"-joined program messages when the block ends, followed
+    # by a single error queue check. A query flushes the queue first.
+    def __init__(self, session, max_len=MAX_PROGRAM_MESSAGE):
+        self.session = session
+        self.max_len = max_len
+        self.cmds = []
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+            self.checkErrors()
+        return False
+
+    def write(self, cmd):
+        cmd = cmd.strip()
+        # Each command restarts at the root, otherwise "TRIG:LEV" after ":TRIG:SOUR"
+        # would be parsed as TRIG:TRIG:LEV within the same message
+        if not cmd.startswith(("*", ":")):
+            cmd = ":" + cmd
+        self.cmds.append(cmd)
+        return len(cmd)
+
+    def query(self, cmd):
+        self.flush()
+        return self.session.query(cmd)
+
+    def flush(self):
+        msg = ""
+        for cmd in self.cmds:
+            if msg and len(msg) + 1 + len(cmd) > self.max_len:
+                self.session.write(msg)
+                msg = ""
+            msg = f"{msg};{cmd}" if msg else cmd
+        if msg:
+            self.session.write(msg)
+        self.cmds = []
+
+    def checkErrors(self):
+        for _ in range(MAX_ERROR_READS):
+            resp = self.session.query("SYST:ERR?").strip()
+            if int(resp.split(",")[0]) == 0:
+                break
+            self.errors.append(resp)
+        if self.errors:
+            print(f"instr: SCPI errors on {getattr(self.session, 'resource_name', '?')}:", "; ".join(self.errors))
+        return self.errors
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
 class instr:
-    def __init__(self):
-        self.rm = pyvisa.ResourceManager()
+    def __init__(self, rm=None):
+        self.rm = rm if rm is not None else openResourceManager()
         self.defaultRM = self.rm
         self.osc = None
         self.sig = None
@@ -31,6 +216,23 @@ class instr:
         self.extps = None
         self.stsps = None
         self.txps = None
+        self.init_times = {}
+        self.opcStrategy = OPC_STRATEGY
+        self.lastOpcWait = None
+        # Profile cache: settings after the last *RST as read back, settings we
+        # have applied since, and a hash of their readback to detect front-panel changes
+        self.oscBaseline = None
+        self.oscState = None
+        self.oscDigest = None
+        self.oscProfile = None
+        self.oscVerify = True
+        # Waveform source/points currently set up, and the last record transferred
+        self.oscWavSetup = None
+        self.lastWaveform = None
+        # Phase times in ms of the last oscAcquire and the last oscMeasure
+        self.acqTimes = {}
+        self.oscTimes = {}
+        self.lastPulseStats = None
 
     def __del__(self):
         self.close()
@@ -38,16 +240,76 @@ class instr:
     def delay(self, d_ms):
         time.sleep(d_ms / 1000.0)
 
-    def WaitForOperationComplete(self, instrSession):
+    def batch(self, session):
+        return SCPIBatch(session)
+
+    def WaitForOperationComplete(self, instrSession, strategy=None, timeout_ms=OPC_TIMEOUT_MS):
+        # Returns the time waited in ms, or -1 if the instrument did not complete in time
+        strategy = strategy or self.opcStrategy
+        start = time.perf_counter()
         try:
-            instrSession.write("*OPC")
-            while True:
-                response = int(instrSession.query("*ESR?").strip())
-                if (response & 1) == 1:
-                    break
-                time.sleep(0.005)
+            if strategy == "opc_query":
+                self._opcQuery(instrSession, timeout_ms)
+            elif strategy == "srq":
+                self._opcSrq(instrSession, timeout_ms)
+            elif strategy == "poll":
+                self._opcPoll(instrSession, timeout_ms)
+            else:
+                raise ValueError(f"unknown operation complete strategy {strategy!r}")
+        except (pyvisa.VisaIOError, TimeoutError) as e:
+            print(f"instr: operation complete wait failed ({strategy}):", e)
+            self.lastOpcWait = -1
+            return -1
+        self.lastOpcWait = (time.perf_counter() - start) * 1000.0
+        return self.lastOpcWait
+
+    def _opcQuery(self, instrSession, timeout_ms):
+        previous = instrSession.timeout
+        instrSession.timeout = timeout_ms
+        try:
+            instrSession.query("*OPC?")
         except pyvisa.VisaIOError:
-            pass
+            # Drop the late "1" so it is not read as the answer to the next query
+            try:
+                instrSession.clear()
+            except Exception:
+                pass
+            raise
+        finally:
+            instrSession.timeout = previous
+
+    def _opcSrq(self, instrSession, timeout_ms):
+        event = pyvisa.constants.EventType.service_request
+        try:
+            instrSession.enable_event(event, pyvisa.constants.EventMechanism.queue)
+        except (pyvisa.VisaIOError, NotImplementedError, AttributeError) as e:
+            # Transport without service requests (raw socket, serial): poll instead
+            print("instr: no SRQ on this session, polling for operation complete:", e)
+            return self._opcPoll(instrSession, timeout_ms)
+        try:
+            # Reading *ESR? clears a stale OPC bit without emptying the error queue as *CLS would
+            instrSession.write("*ESE 1;*SRE 32")
+            instrSession.query("*ESR?")
+            instrSession.write("*OPC")
+            instrSession.wait_on_event(event, timeout_ms)
+            instrSession.read_stb()
+        finally:
+            instrSession.disable_event(event, pyvisa.constants.EventMechanism.queue)
+            instrSession.write("*SRE 0")
+
+    def _opcPoll(self, instrSession, timeout_ms):
+        deadline = time.perf_counter() + timeout_ms / 1000.0
+        interval = OPC_POLL_MIN
+        instrSession.query("*ESR?")
+        instrSession.write("*OPC")
+        while True:
+            response = int(instrSession.query("*ESR?").strip())
+            if (response & 1) == 1:
+                return
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"no operation complete after {timeout_ms} ms")
+            time.sleep(interval)
+            interval = min(interval * 2, OPC_POLL_MAX)
 
     def close(self):
         for inst in [self.sig, self.osc, self.awg, self.powm, self.fc]:
@@ -71,26 +333,47 @@ class instr:
         except Exception:
             pass
 
-    def initGpib(self):
-        for fn in [self.initAwgCont, self.initPowm, self.initSig, self.initOsc, self.initFreqCounter]:
-            ret = fn()
+    def initGpib(self, parallel=False):
+        steps = [self.initAwgCont, self.initPowm, self.initSig, self.initOsc, self.initFreqCounter]
+        if powerSupplyType == TDK_LAMBDA:
+            steps += [self.initExtPs, self.initStsPs, self.initTxPS]
+
+        # Per-instrument init time in ms, keyed by init method name
+        self.init_times = {}
+        start = time.perf_counter()
+        if parallel:
+            # Every instrument has its own session, so they can all come up at once;
+            # the first failure in the sequential order is reported
+            with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+                rets = list(pool.map(self._timedInit, steps))
+        else:
+            rets = []
+            for fn in steps:
+                rets.append(self._timedInit(fn))
+                if rets[-1] != 0:
+                    break
+        self.init_times["total"] = (time.perf_counter() - start) * 1000.0
+
+        for ret in rets:
             if ret != 0:
                 return ret
 
-        if powerSupplyType == TDK_LAMBDA:
-            for fn in [self.initExtPs, self.initStsPs, self.initTxPS]:
-                ret = fn()
-                if ret != 0:
-                    return ret
-
         print("instr: All Instr Opened")
         return 0
 
+    def _timedInit(self, fn):
+        t0 = time.perf_counter()
+        ret = fn()
+        self.init_times[fn.__name__] = (time.perf_counter() - t0) * 1000.0
+        return ret
+
     def initOsc(self):
         try:
             visa_address = f"TCPIP0::{OSC_IP}::inst0::INSTR"
             self.osc = self.rm.open_resource(visa_address, open_timeout=100)
             self.osc.write("*RST")
+            self.oscState = None
+            self.oscWavSetup = None
             print("instr: OSC Instr Opened")
             return 0
         except Exception as e:
@@ -101,19 +384,20 @@ class instr:
         try:
             visa_address = f"TCPIP0::{SIG_IP}::inst0::INSTR"
             self.sig = self.rm.open_resource(visa_address, open_timeout=100)
-            self.sig.write("*RST")
-            self.sig.write("POWER -20DBM")
-            
-            if EXPORT_VER:
-                self.sig.write("FREQ 9.34GHZ")
-            else:
-                self.sig.write("FREQ 9.32GHZ")
-                
-            self.sig.write(":POW:ALC OFF")
-            self.sig.write("PULM:SOUR EXT")
-            self.sig.write("PULM:EXT:POL NORM")
-            self.sig.write("PULM:STAT ON")
-            self.sig.write("DISP OFF")
+            with self.batch(self.sig) as sig:
+                sig.write("*RST")
+                sig.write("POWER -20DBM")
+
+                if EXPORT_VER:
+                    sig.write("FREQ 9.34GHZ")
+                else:
+                    sig.write("FREQ 9.32GHZ")
+
+                sig.write(":POW:ALC OFF")
+                sig.write("PULM:SOUR EXT")
+                sig.write("PULM:EXT:POL NORM")
+                sig.write("PULM:STAT ON")
+                sig.write("DISP OFF")
             print("instr: SIG GEN Instr Opened")
             return 0
         except Exception as e:
@@ -124,13 +408,14 @@ class instr:
         try:
             visa_address = f"TCPIP0::{AWG_IP}::inst0::INSTR"
             self.awg = self.rm.open_resource(visa_address, open_timeout=100)
-            self.awg.write("*RST")
-            self.awg.write("DISP OFF")
-            self.awg.write("FUNC SQU")
-            self.awg.write("FREQ 16MHZ")
-            self.awg.write("VOLT 5.0VPP")
-            self.awg.write("VOLT:OFFSET 0")
-            self.awg.write("OUTP:STAT ON")
+            with self.batch(self.awg) as awg:
+                awg.write("*RST")
+                awg.write("DISP OFF")
+                awg.write("FUNC SQU")
+                awg.write("FREQ 16MHZ")
+                awg.write("VOLT 5.0VPP")
+                awg.write("VOLT:OFFSET 0")
+                awg.write("OUTP:STAT ON")
             print("instr: AWG Instr Opened")
             return 0
         except Exception as e:
@@ -175,14 +460,15 @@ class instr:
         try:
             visa_address = f"TCPIP0::{FC_IP}::inst0::INSTR"
             self.fc = self.rm.open_resource(visa_address, open_timeout=100)
-            self.fc.write("*RST")
-            self.fc.write("DISP OFF")
-            self.fc.write(":CONF:FREQ:BURS (@3)")
-            self.fc.write(":INP:BURS:LEV -6")
-            self.fc.write(":SENS:FREQ:BURS:GATE:NARR ON")
-            self.fc.write(":SENS:FREQ:BURS:GATE:AUTO ON")
-            self.fc.write("SENS:ROSC:SOUR:AUTO OFF")
-            self.fc.write("SENS:ROSC:SOUR INT")
+            with self.batch(self.fc) as fc:
+                fc.write("*RST")
+                fc.write("DISP OFF")
+                fc.write(":CONF:FREQ:BURS (@3)")
+                fc.write(":INP:BURS:LEV -6")
+                fc.write(":SENS:FREQ:BURS:GATE:NARR ON")
+                fc.write(":SENS:FREQ:BURS:GATE:AUTO ON")
+                fc.write("SENS:ROSC:SOUR:AUTO OFF")
+                fc.write("SENS:ROSC:SOUR INT")
             print("instr: FC opened")
             return 0
         except Exception as e:
@@ -300,147 +586,200 @@ class instr:
         except Exception:
             return 7
 
-    def configOscCgu(self):
+    def resetOsc(self):
         self.osc.write("*RST")
         self.WaitForOperationComplete(self.osc)
-        self.osc.write(":BLANK")
-        self.osc.write(":CHAN1:DISP ON")
-        self.osc.write(":CHAN1:IMP FIFT")
-        self.osc.write(":CHAN1:PROB 1")
-        self.osc.write(":CHAN1:COUP DC")
-        self.osc.write(":CHAN1:SCAL 300mV")
-        self.osc.write(":CHAN1:OFFS -900mV")
-        self.osc.write(":TIM:REF CENT")
-        self.osc.write(":TIM:SCAL 2E-7")
-        self.osc.write(":TIM:MODE MAIN")
+        self.oscBaseline = self._oscReadback()
+        self.oscState = dict(self.oscBaseline)
+        self.oscDigest = None
+        self.oscProfile = None
+        self.oscWavSetup = None
+
+    def _oscReadback(self):
+        # All tracked settings in one compound query
+        resp = self.osc.query(";".join(f":{key}?" for key in OSC_STATE_KEYS))
+        return dict(zip(OSC_STATE_KEYS, (v.strip() for v in resp.strip().split(";"))))
+
+    def _oscHash(self):
+        return hashlib.sha1(";".join(self._oscReadback().values()).encode()).hexdigest()
+
+    def applyOscProfile(self, name, reset=False):
+        # Returns the number of commands sent; a reset only when asked for, on first
+        # use, or when the scope no longer matches what was last applied
+        if not reset and self.oscState is not None and self.oscVerify and self.oscDigest is not None:
+            if self._oscHash() != self.oscDigest:
+                print("instr: OSC settings changed outside the profile cache, resetting")
+                reset = True
+        if reset or self.oscState is None:
+            self.resetOsc()
+        sent = self.applyOscSettings({**self.oscBaseline, **OSC_PROFILES[name]})
+        self.oscProfile = name
+        return sent
+
+    def applyOscSettings(self, settings):
+        # Sends only the settings that differ from the cached state
+        if self.oscState is None:
+            self.resetOsc()
+        changed = {key: value for key, value in settings.items() if self.oscState.get(key) != value}
+        if "TRIG:EDGE:SOUR" in changed and "TRIG:LEV" in settings:
+            changed["TRIG:LEV"] = settings["TRIG:LEV"]
+        if not changed:
+            return 0
+        with self.batch(self.osc) as osc:
+            for key in OSC_STATE_KEYS:
+                if key in changed:
+                    osc.write(f":{key} {changed[key]}")
+        self.oscState.update(changed)
+        if self.oscVerify:
+            self.oscDigest = self._oscHash()
+        return len(changed)
+
+    def configOscCgu(self):
+        self.applyOscProfile("cgu")
 
     def configOscCguPulse(self):
-        self.osc.write(":TRIG:TV:SOURCE CHAN1")
-        self.osc.write(":TRIG:SWE NORM")
-        self.osc.write(":TRIG:MODE EDGE")
-        self.osc.write(":TRIG:EDGE:SLOP NEG")
-        self.osc.write(":TRIG:LEV -100mV")
+        self.applyOscSettings(OSC_CGU_PULSE)
 
     def configOscCguPulseCapture(self):
-        self.osc.write(":CHAN1:IMP FIFT")
-        self.osc.write(":TRIG:MODE EDGE")
-        self.osc.write(":TRIGger:EDGE:SOURce CHANnel1")
-        self.osc.write(":TRIG:LEV -500mV")
-        self.osc.write(":TRIG:EDGE:SLOP NEG")
-        self.osc.write(":TRIG:SWE NORM")
+        self.applyOscSettings(OSC_CGU_CAPTURE)
 
     def configOscContLeft(self):
-        self.osc.write("*RST")
-        self.WaitForOperationComplete(self.osc)
-        self.osc.write(":BLANK")
-        self.osc.write(":CHAN2:DISP ON")
-        self.osc.write(":TIM:SCAL 50E-3")
-        self.osc.write(":CHAN2:SCAL 5V")
-    
+        self.applyOscProfile("cont_left")
+
     def configOscContRight(self):
-        self.osc.write("*RST")
-        self.WaitForOperationComplete(self.osc)
-        self.osc.write(":BLANK")
-        self.osc.write(":CHAN3:DISP ON")
-        self.osc.write(":TIM:SCAL 50E-3")
-        self.osc.write(":CHAN3:SCAL 5V")
-    
+        self.applyOscProfile("cont_right")
+
     def configOscPulseLeft(self):
-        self.osc.write("*RST")
-        self.WaitForOperationComplete(self.osc)
-        self.osc.write(":BLANK")
-        self.osc.write(":CHAN2:DISP ON")
-        self.osc.write(":TIM:SCAL 5E-2")
-        self.osc.write(":TRIG:SWE NORM")
-        self.osc.write(":TRIG:MODE EDGE")
-        self.osc.write(":TRIG:SOUR CHAN2")
-        self.osc.write("TRIG:EDGE:SLOPE POS")
-        self.osc.write("TRIG:LEV 8.63V")
+        self.applyOscProfile("pulse_left")
         self.WaitForOperationComplete(self.osc)
-    
+
     def configOscPulseRight(self):
-        self.osc.write("*RST")
+        self.applyOscProfile("pulse_right")
         self.WaitForOperationComplete(self.osc)
-        self.osc.write(":BLANK")
-        self.osc.write(":CHAN3:DISP ON")
-        self.osc.write(":TIM:SCAL 5E-2")
-        self.osc.write(":TRIG:SWE NORM")
-        self.osc.write(":TRIG:MODE EDGE")
-        self.osc.write(":TRIG:SOUR CHAN3")
-        self.osc.write("TRIG:EDGE:SLOPE POS")
-        self.osc.write("TRIG:LEV 8.63V")
+
+    def captureWaveform(self, ch=1, points=WAV_POINTS, segments=1):
+        # One binary block transfer of the stopped record as signed 16-bit words;
+        # with segments > 1 every segment comes back in the same block
+        setup = (ch, points, segments)
+        if self.oscWavSetup != setup:
+            with self.batch(self.osc) as osc:
+                osc.write(f":WAV:SOUR CHAN{ch}")
+                osc.write(":WAV:FORM WORD")
+                osc.write(":WAV:BYT LSBF")
+                osc.write(":WAV:UNS 0")
+                osc.write(":WAV:POIN:MODE RAW")
+                osc.write(f":WAV:POIN {points}")
+                if segments > 1:
+                    osc.write(":WAV:SEGM:ALL ON")
+                elif self.oscWavSetup is not None and self.oscWavSetup[2] > 1:
+                    osc.write(":WAV:SEGM:ALL OFF")
+            self.oscWavSetup = setup
+        preamble = self.osc.query(":WAV:PRE?")
+        self.osc.write(":WAV:DATA?")
+        self.lastWaveform = Waveform(ch, preamble, self.osc.read_raw(), segments=segments)
+        return self.lastWaveform
+
+    def _pollUntil(self, ready, deadline):
+        interval = OPC_POLL_MIN
+        while not ready():
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(interval)
+            interval = min(interval * 2, OPC_POLL_MAX)
+        return True
+
+    def oscAcquire(self, timeout_ms=OSC_ACQ_TIMEOUT_MS, arm=True, trigger=None):
+        # Arms a single acquisition, runs trigger() once armed, and returns as soon as
+        # the run bit drops: 1 captured, 0 still waiting at the deadline, -1 never armed
+        times = {}
+        start = time.perf_counter()
+        deadline = start + timeout_ms / 1000.0
+        self.acqTimes = times
+        if arm:
+            self.osc.write(":SING")
+            armed = self._pollUntil(lambda: int(self.osc.query(":AER?").strip()) == 1, deadline)
+            times["arm"] = (time.perf_counter() - start) * 1000.0
+            if not armed:
+                return -1
+        if trigger is not None:
+            t = time.perf_counter()
+            trigger()
+            times["trigger"] = (time.perf_counter() - t) * 1000.0
+        t = time.perf_counter()
+        done = self._pollUntil(lambda: int(self.osc.query(":OPER:COND?").strip()) & 0x0008 == 0, deadline)
+        times["wait"] = (time.perf_counter() - t) * 1000.0
+        return 1 if done else 0
+
+    def oscMeasureSegmented(self, segments=OSC_SEGMENTS, timeout_ms=OSC_SEGMENT_TIMEOUT_MS):
+        # N pulses in one arm and one transfer; returns {parameter: PulseStats} over the
+        # segments with a valid width, or None if the segments did not fill before the
+        # deadline or none held a valid pulse
+        self.applyOscProfile("cgu_segmented")
+        self.osc.write(f":ACQ:SEGM:COUN {segments}")
         self.WaitForOperationComplete(self.osc)
+        if self.oscAcquire(timeout_ms) != 1:
+            self.lastPulseStats = None
+            return None
+        wf = self.captureWaveform(1, segments=segments)
+        params = inWidth(analyseSegments(wf.segmentVolts(), wf.dt, negative=True), CGU_WIDTH_MIN, CGU_WIDTH_MAX)
+        self.lastPulseStats = pulseStatistics(params) if len(params) else None
+        return self.lastPulseStats
+
+    def oscMeasure(self, segments=0):
+        if segments > 1:
+            stats = self.oscMeasureSegmented(segments)
+            if stats is None:
+                return 0.0, -1.0, -1.0, -1.0
+            return stats["amplitude"].mean, stats["width"].mean, stats["fall"].mean, stats["rise"].mean
 
-    def oscMeasure(self):
         pAmp = 0.0
         pwidth = -1.0
         ft = -1.0
         rt = -1.0
         count = 0
         pwidth_tot = 0.0
+        times = {"config": 0.0, "acquire": 0.0, "transfer": 0.0, "analysis": 0.0}
+        self.oscTimes = times
 
-        self.configOscCgu()
-        self.configOscCguPulseCapture()
+        t = time.perf_counter()
+        self.applyOscProfile("cgu_capture")
         self.WaitForOperationComplete(self.osc)
+        times["config"] = (time.perf_counter() - t) * 1000.0
 
         for _ in range(3):
             status = 0
             retryCount = 0
-            
-            self.osc.write(":SING")
-            self.delay(1000)
-            
-            start = time.monotonic()
-
-            while status == 0:
-                reg = int(self.osc.query(":OPERegister:CONDition?").strip())
-                runFlag = reg & 0x0008
-
-                if runFlag == 0:
-                    self.osc.write(":MEAS:VAMP CHAN1")
-                    self.WaitForOperationComplete(self.osc)
-                    
-                    pAmp = float(self.osc.query(":MEAS:VAMP? CHAN1"))
-
-                    self.osc.write(":MEAS:NWIDTH CHAN1")
-                    self.osc.write(":MEAS:FALL CHAN1")
-                    self.osc.write(":MEAS:RIS CHAN1")
-                    self.WaitForOperationComplete(self.osc)
-
-                    pwidth = float(self.osc.query(":MEAS:NWIDTH? CHAN1"))
-                    ft = float(self.osc.query(":MEAS:FALL? CHAN1"))
-                    rt = float(self.osc.query(":MEAS:RIS? CHAN1"))
-
-                    if 2e-7 < pwidth < 4e-7:
-                        status = 1
-                        break
-                    else:
-                        break
-
-                elapsed_ms = (time.monotonic() - start) * 1000
-                if elapsed_ms > 2000:
-                    if retryCount == 0:
-                        self.osc.write(":CHAN1:SCAL 100mV")
-                        self.osc.write(":CHAN1:OFFS -300mV")
-                        self.osc.write(":TRIG:LEV -200mV")
-                    else:
-                        self.osc.write(":CHAN1:SCAL 50mV")
-                        self.osc.write(":CHAN1:OFFS -150mV")
-                        self.osc.write(":TRIG:LEV -100mV")
-
-                    retryCount += 1
-                    if retryCount == 3:
-                        break
-                    self.delay(200)
-
-                self.delay(100)
+
+            t = time.perf_counter()
+            ret = self.oscAcquire(OSC_ACQ_TIMEOUT_MS)
+            while ret == 0:
+                # No pulse yet: raise the sensitivity while the acquisition stays armed
+                if retryCount == 0:
+                    self.applyOscSettings({"CHAN1:SCAL": "100mV", "CHAN1:OFFS": "-300mV", "TRIG:LEV": "-200mV"})
+                else:
+                    self.applyOscSettings({"CHAN1:SCAL": "50mV", "CHAN1:OFFS": "-150mV", "TRIG:LEV": "-100mV"})
+
+                retryCount += 1
+                if retryCount == 3:
+                    break
+                ret = self.oscAcquire(OSC_RETRY_MS, arm=False)
+            times["acquire"] += (time.perf_counter() - t) * 1000.0
+
+            if ret == 1:
+                t = time.perf_counter()
+                wf = self.captureWaveform(1)
+                times["transfer"] += (time.perf_counter() - t) * 1000.0
+                t = time.perf_counter()
+                pAmp, pwidth, rt, ft = analysePulse(wf.volts, wf.dt, negative=True)
+                times["analysis"] += (time.perf_counter() - t) * 1000.0
+                if CGU_WIDTH_MIN < pwidth < CGU_WIDTH_MAX:
+                    status = 1
 
             if status == 1:
                 count += 1
                 pwidth_tot += pwidth
                 pwidth = pwidth_tot / count
 
-        self.delay(2000)
         return pAmp, pwidth, ft, rt
 
     def oscMeasureE2NV(self):
@@ -452,77 +791,44 @@ class instr:
         except Exception:
             return -1.0
 
+    def firingPulseOscAmplitude(self, channels=(2, 3)):
+        # One arm and one AWG trigger for every fin channel; returns (1, {ch: (amp, width)})
+        # or (0, {ch: (-1.0, -1.0)}) if nothing was captured in time. The combined capture
+        # triggers on the first channel only, so if it times out each fin is captured on its
+        # own and a fin that gave nothing reads (-1.0, -1.0).
+        channels = tuple(channels)
+        if channels not in OSC_PULSE_PROFILES:
+            raise ValueError(f"no firing pulse profile for scope channels {channels}; use one of {sorted(OSC_PULSE_PROFILES)}")
+        self.applyOscProfile(OSC_PULSE_PROFILES[channels])
+        self.WaitForOperationComplete(self.osc)
+
+        def trigger():
+            self.awg.write("*TRG")
+            self.WaitForOperationComplete(self.awg)
+
+        if self.oscAcquire(FIRING_PULSE_TIMEOUT_MS, trigger=trigger) != 1:
+            if len(channels) == 1:
+                return 0, {channels[0]: (-1.0, -1.0)}
+            print("instr: no combined firing pulse capture, capturing each fin on its own")
+            status, result = 0, {}
+            for ch in channels:
+                ch_status, ch_result = self.firingPulseOscAmplitude((ch,))
+                status |= ch_status
+                result.update(ch_result)
+            return status, result
+
+        # Every amplitude and width in one compound query
+        resp = self.osc.query(";".join(f":MEAS:VAMP? CHAN{ch};:MEAS:PWIDTH? CHAN{ch}" for ch in channels))
+        values = [float(v) for v in resp.strip().split(";")]
+        return 1, {ch: (values[2 * i], values[2 * i + 1]) for i, ch in enumerate(channels)}
+
     def firingPulseOscAmplitudeLeft(self):
-        fpAmp = 0.0
-        fpWidth = 0.0
-        TIMEOUT = 5000 
-        
-        self.configOscPulseLeft()   
-        self.osc.write(":SING")
-        self.delay(2000)  
-        
-        self.awg.write("TRIG")
-        self.WaitForOperationComplete(self.awg)
-        
-        start_time = time.monotonic()
-        elapsed = 0
-        
-        while elapsed <= TIMEOUT:
-            varQueryResult = int(self.osc.query(":OPERegister:CONDition?").strip())
-            runFlag = varQueryResult & 0x0008
-            
-            if runFlag == 0:
-                break
-            else:
-                self.delay(100)
-                elapsed = (time.monotonic() - start_time) * 1000
-                
-        if elapsed < TIMEOUT:
-            self.osc.write(":MEAS:VAMP CHAN2")
-            self.osc.write(":MEAS:PWIDTH CHAN2")
-            self.WaitForOperationComplete(self.osc)
-            fpAmp = float(self.osc.query(":MEAS:VAMP? CHAN2"))
-            fpWidth = float(self.osc.query(":MEAS:PWIDTH? CHAN2"))
-            return 1, fpAmp, fpWidth
-        else:
-            self.configOscPulseLeft()
-            return 0, -1.0, -1.0
+        status, result = self.firingPulseOscAmplitude((2,))
+        return (status,) + result[2]
 
     def firingPulseOscAmplitudeRight(self):
-        fpAmp = 0.0
-        fpWidth = 0.0
-        TIMEOUT = 5000 
-        
-        self.configOscPulseRight()  
-        self.osc.write(":SING")
-        self.delay(2000)
-        
-        self.awg.write("*TRG")
-        self.WaitForOperationComplete(self.awg)
-        
-        start_time = time.monotonic()
-        elapsed = 0
-        
-        while elapsed <= TIMEOUT:
-            varQueryResult = int(self.osc.query(":OPERegister:CONDition?").strip())
-            runFlag = varQueryResult & 0x0008
-            
-            if runFlag == 0:   
-                break
-            else:
-                self.delay(100)
-                elapsed = (time.monotonic() - start_time) * 1000
-
-        if elapsed < TIMEOUT:
-            self.osc.write(":MEAS:VAMP CHAN3")
-            self.osc.write(":MEAS:PWIDTH CHAN3")
-            self.WaitForOperationComplete(self.osc)
-            fpAmp = float(self.osc.query(":MEAS:VAMP? CHAN3"))
-            fpWidth = float(self.osc.query(":MEAS:PWIDTH? CHAN3"))
-            return 1, fpAmp, fpWidth
-        else:
-            self.configOscPulseRight()
-            return 0, -1.0, -1.0
+        status, result = self.firingPulseOscAmplitude((3,))
+        return (status,) + result[3]
 
     def measureFrequency(self):
         retryCount = 0
@@ -0,0 +1,230 @@
+import atexit
+import struct
+import sys
+import time
+from collections import defaultdict, deque
+
+# t_ns (monotonic), op, channel/port, value written, call result
+RECORD = struct.Struct("<qBxhdd")
+HEADER = struct.Struct("<4sHHQQ")
+MAGIC = b"APTR"
+VERSION = 1
+
+OP_READ_DI = 1
+OP_READ_DI_PORT = 2
+OP_WRITE_DO = 3
+OP_WRITE_DO_PORT = 4
+OP_WRITE_OPTO = 5
+OP_WRITE_OPTO_PORT = 6
+OP_READ_AI = 7
+
+OP_NAMES = {
+    OP_READ_DI: "read_di",
+    OP_READ_DI_PORT: "read_di_port",
+    OP_WRITE_DO: "write_do",
+    OP_WRITE_DO_PORT: "write_do_port",
+    OP_WRITE_OPTO: "write_opto",
+    OP_WRITE_OPTO_PORT: "write_opto_port",
+    OP_READ_AI: "read_ai",
+}
+
+# libacromag entry point -> (op, is_write)
+TRACED_CALLS = {
+    "ap_read_di": (OP_READ_DI, False),
+    "ap_read_di_port": (OP_READ_DI_PORT, False),
+    "ap_read_ai": (OP_READ_AI, False),
+    "ap_write_do": (OP_WRITE_DO, True),
+    "ap_write_do_port": (OP_WRITE_DO_PORT, True),
+    "ap_write_opto_do": (OP_WRITE_OPTO, True),
+    "ap_write_opto_port": (OP_WRITE_OPTO_PORT, True),
+}
+
+
+class IOTracer:
+    # Fixed-size ring of packed records; the oldest entries are overwritten
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.buf = bytearray(capacity * RECORD.size)
+        self.count = 0
+        self._pack = RECORD.pack_into
+        self._now = time.monotonic_ns
+        self._crash_path = None
+
+    def record(self, op, ch, value, result):
+        # Callers hold the card lock, so count needs no lock of its own
+        self._pack(self.buf, (self.count % self.capacity) * RECORD.size, self._now(), op, ch, value, result)
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def records(self):
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        for i in range(first, self.count):
+            yield RECORD.unpack_from(self.buf, (i % self.capacity) * RECORD.size)
+
+    def dump(self, path):
+        n = min(self.count, self.capacity)
+        start = (self.count - n) % self.capacity * RECORD.size
+        end = start + n * RECORD.size
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, n, self.count - n))
+            if end <= len(self.buf):
+                f.write(self.buf[start:end])
+            else:
+                f.write(self.buf[start:])
+                f.write(self.buf[:end - len(self.buf)])
+        return n
+
+    def dump_on_crash(self, path):
+        # Write the ring out on an uncaught exception or at interpreter exit
+        if self._crash_path is None:
+            atexit.register(self._dump_crash)
+            previous = sys.excepthook
+
+            def hook(exc_type, exc, tb):
+                self._dump_crash()
+                previous(exc_type, exc, tb)
+
+            sys.excepthook = hook
+        self._crash_path = path
+
+    def _dump_crash(self):
+        if self._crash_path is not None and self.count:
+            try:
+                self.dump(self._crash_path)
+            except OSError as e:
+                print("APCard: trace dump failed:", e)
+
+
+def load(path):
+    with open(path, "rb") as f:
+        magic, version, size, n, dropped = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or size != RECORD.size:
+            raise ValueError(f"{path}: not an APCard I/O trace")
+        data = f.read(n * size)
+    return [RECORD.unpack_from(data, i * size) for i in range(n)]
+
+
+def format_records(records):
+    if not records:
+        return
+    t0 = records[0][0]
+    for t_ns, op, ch, value, result in records:
+        yield f"{(t_ns - t0) / 1e6:12.3f} ms  {OP_NAMES.get(op, op):<16} ch={ch:<3} value={value:g} result={result:g}"
+
+
+class TracingCard:
+    # Wraps a libacromag handle and records every traced entry point
+    def __init__(self, card, tracer):
+        self.card = card
+        self.tracer = tracer
+        for name, (op, is_write) in TRACED_CALLS.items():
+            fn = getattr(card, name, None)
+            if fn is not None:
+                setattr(self, name, _traced_write(fn, op, tracer.record) if is_write else _traced_read(fn, op, tracer.record))
+
+    def __getattr__(self, name):
+        return getattr(self.card, name)
+
+
+def _traced_read(fn, op, record):
+    def call(ch):
+        result = fn(ch)
+        record(op, ch, 0.0, result)
+        return result
+    return call
+
+
+def _traced_write(fn, op, record):
+    def call(ch, value):
+        result = fn(ch, value)
+        record(op, ch, value, result if result is not None else 0)
+        return result
+    return call
+
+
+class ReplayCard:
+    # Serves the reads of a recorded trace back and checks writes against it.
+    # Reads are served per (op, channel); writes are checked against the single
+    # recorded write sequence, so a reordering across channels is a mismatch.
+    # A read past the end of its recording repeats the last value and is a mismatch too.
+    # realtime=True also holds each call until its recorded offset from the first record.
+    def __init__(self, records, realtime=False):
+        if isinstance(records, str):
+            records = load(records)
+        self.realtime = realtime
+        self.t0 = records[0][0] if records else 0
+        self.start = None
+        self.mismatches = []
+        self.drift = []
+        self._pending = defaultdict(deque)
+        self._writes = deque()
+        write_ops = {op for op, is_write in TRACED_CALLS.values() if is_write}
+        for t_ns, op, ch, value, result in records:
+            if op in write_ops:
+                self._writes.append((t_ns, op, ch, value, result))
+            else:
+                self._pending[op, ch].append((t_ns, value, result))
+        self._last = {}
+        recorded = {op for _, op, _, _, _ in records}
+        for name, (op, is_write) in TRACED_CALLS.items():
+            # Port entry points only exist if the recorded driver had them
+            if name.endswith("_port") and op not in recorded:
+                continue
+            setattr(self, name, self._writer(op) if is_write else self._reader(op))
+
+    def ap_open(self):
+        self.start = time.monotonic_ns()
+        return 0
+
+    def ap_close(self):
+        return 0
+
+    def _hold(self, t_ns, op, ch):
+        if self.start is None:
+            self.start = time.monotonic_ns()
+        offset = t_ns - self.t0
+        if self.realtime:
+            wait = self.start + offset - time.monotonic_ns()
+            if wait > 0:
+                time.sleep(wait / 1e9)
+        self.drift.append((op, ch, time.monotonic_ns() - self.start - offset))
+
+    def _reader(self, op):
+        def call(ch):
+            queue = self._pending.get((op, ch))
+            if not queue:
+                self.mismatches.append((OP_NAMES[op], ch, None, None))
+                return self._last.get((op, ch), 0)
+            t_ns, _, result = queue.popleft()
+            self._hold(t_ns, op, ch)
+            self._last[op, ch] = result
+            return result if op == OP_READ_AI else int(result)
+        return call
+
+    def _writer(self, op):
+        # Mismatches are (call, ch, value, (recorded call, ch, value) or None);
+        # an unrecorded read is (call, ch, None, None)
+        def call(ch, value):
+            if not self._writes:
+                self.mismatches.append((OP_NAMES[op], ch, value, None))
+                return 0
+            t_ns, r_op, r_ch, r_value, result = self._writes.popleft()
+            self._hold(t_ns, op, ch)
+            if (r_op, r_ch, r_value) != (op, ch, value):
+                self.mismatches.append((OP_NAMES[op], ch, value, (OP_NAMES[r_op], r_ch, r_value)))
+            return int(result)
+        return call
+
+    def unplayed_writes(self):
+        return [(OP_NAMES[op], ch, value) for _, op, ch, value, _ in self._writes]
+
+    def max_drift_ms(self):
+        return max((abs(d) for _, _, d in self.drift), default=0) / 1e6
+
+
+if __name__ == "__main__":
+    for line in format_records(load(sys.argv[1])):
+        print(line)
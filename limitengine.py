@@ -0,0 +1,77 @@
+import numpy as np
+
+PASS = 0
+WARN = 1
+FAIL = 2
+
+# Fraction of the low..high span treated as the warning band at each edge;
+# a one-sided limit takes the fraction of its own magnitude instead
+WARN_MARGIN = 0.1
+
+
+class LimitResult:
+    __slots__ = ("status", "fail_mask", "warn_mask", "first_violation", "timestamp")
+
+    def __init__(self, status, fail_mask, warn_mask, first_violation, timestamp):
+        self.status = status
+        self.fail_mask = fail_mask
+        self.warn_mask = warn_mask
+        self.first_violation = first_violation
+        self.timestamp = timestamp
+
+    @property
+    def ok(self):
+        return self.fail_mask == 0
+
+
+def _side(value, default):
+    # A side set to None is deliberately open
+    return default if value is None else value
+
+
+def _bitmask(flags):
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+class LimitEngine:
+    # Limits for a scan list compiled into low/high arrays. table maps each scan name
+    # to (low, high); a side set to None is open, and a scan channel missing from the
+    # table is refused rather than never failing.
+    def __init__(self, table, names, warn_margin=WARN_MARGIN):
+        self.names = tuple(names)
+        n = len(self.names)
+        missing = [name for name in self.names if name not in table]
+        if missing:
+            raise ValueError("no limits for scan channels: " + ", ".join(missing) + " (map a channel to (None, None) to leave it open)")
+        self.low = np.array([_side(table[name][0], -np.inf) for name in self.names], dtype=np.float64)
+        self.high = np.array([_side(table[name][1], np.inf) for name in self.names], dtype=np.float64)
+        span = self.high - self.low
+        both = np.isfinite(span)
+        low_band = np.where(both, span, np.where(np.isfinite(self.low), np.abs(self.low), 0.0)) * warn_margin
+        high_band = np.where(both, span, np.where(np.isfinite(self.high), np.abs(self.high), 0.0)) * warn_margin
+        self.warn_low = self.low + low_band
+        self.warn_high = self.high - high_band
+        self.first_violation = np.full(n, np.nan)
+        self._fail = np.empty(n, dtype=bool)
+        self._warn = np.empty(n, dtype=bool)
+        self._tmp = np.empty(n, dtype=bool)
+
+    def reset(self):
+        self.first_violation.fill(np.nan)
+
+    def evaluate(self, values, timestamp):
+        fail, warn, tmp = self._fail, self._warn, self._tmp
+        np.less(values, self.low, out=fail)
+        np.greater(values, self.high, out=tmp)
+        fail |= tmp
+        np.less(values, self.warn_low, out=warn)
+        np.greater(values, self.warn_high, out=tmp)
+        warn |= tmp
+        warn &= ~fail
+        np.logical_and(fail, np.isnan(self.first_violation), out=tmp)
+        self.first_violation[tmp] = timestamp
+        status = np.where(fail, FAIL, np.where(warn, WARN, PASS))
+        return LimitResult(status, _bitmask(fail), _bitmask(warn), self.first_violation.copy(), timestamp)
+
+    def violations(self, result):
+        return [name for name, s in zip(self.names, result.status) if s == FAIL]
@@ -0,0 +1,164 @@
+import heapq
+import random
+import threading
+import time
+import channel
+import channelmap
+from apcardmanager import DI_PORT_WIDTH, DO_PORT_WIDTH, OPTO_PORT_WIDTH
+
+# Cost of one libacromag call through ctypes on the bench PC
+CALL_LATENCY = 20e-6
+RELAY_ACTUATION = 0.015
+
+# Plain outputs whose contacts are read back on a DI line
+FOLLOWERS = {
+    "G_SWITCH_CLOSE": "G_SWITCH_STATUS",
+}
+
+# Bench-idle analog levels, volts
+AI_LEVELS = {
+    "EXT_VOLT": 31.0,
+    "EXT_CURR": 1.2,
+    "SIM_TB_VOLT": 28.0,
+    "SIM_TB_CURR": 0.8,
+    "TB_MON_VOLT": 27.9,
+    "SUSTAINER_RLY": 0.0,
+    "NOZZLE_MATE": 0.0,
+    "WING_CAGE": 0.0,
+}
+AI_NOISE = 0.02
+
+
+class SimulatedCard:
+    # Stand-in for libacromag.so with the same entry points as the CDLL
+    def __init__(self, call_latency=CALL_LATENCY, actuation=None, port_io=True, seed=None):
+        self.call_latency = call_latency
+        self.do = 0
+        self.di = 0
+        self.opto = 0
+        self.calls = 0
+        self.is_open = False
+        self._events = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+        actuation = actuation or {}
+        # DO channel -> (status DI, level, delay) applied on a rising edge
+        self._edges = {}
+        reg = channelmap.load()
+        for h, name in enumerate(reg.names):
+            status = reg.status(h)
+            if status is None:
+                continue
+            delay = actuation.get(name, RELAY_ACTUATION)
+            self._edges[reg.set_ch[h]] = (status, 1, delay)
+            self._edges[reg.reset_ch[h]] = (status, 0, delay)
+        self._followers = {}
+        for out, status in FOLLOWERS.items():
+            if hasattr(channel, out) and hasattr(channel, status):
+                self._followers[getattr(channel, out)] = getattr(channel, status)
+        self.ai = {getattr(channel, name): level for name, level in AI_LEVELS.items() if hasattr(channel, name)}
+
+        if port_io:
+            self.ap_read_di_port = self._read_di_port
+            self.ap_write_do_port = self._write_do_port
+            self.ap_write_opto_port = self._write_opto_port
+
+    # ---- test hooks ----
+    def set_di(self, ch, value):
+        with self._lock:
+            self._set_di(ch, value)
+
+    def set_ai(self, ch, value):
+        self.ai[ch] = value
+
+    # ---- model ----
+    def _cost(self):
+        self.calls += 1
+        if self.call_latency:
+            end = time.perf_counter() + self.call_latency
+            while time.perf_counter() < end:
+                pass
+
+    def _set_di(self, ch, value):
+        if value:
+            self.di |= 1 << ch
+        else:
+            self.di &= ~(1 << ch)
+
+    def _settle(self):
+        now = time.monotonic()
+        while self._events and self._events[0][0] <= now:
+            _, _, ch, value = heapq.heappop(self._events)
+            self._set_di(ch, value)
+
+    def _drive(self, ch, value):
+        rising = value and not (self.do >> ch) & 1
+        if value:
+            self.do |= 1 << ch
+        else:
+            self.do &= ~(1 << ch)
+        if ch in self._followers:
+            self._set_di(self._followers[ch], value)
+        if rising and ch in self._edges:
+            status, level, delay = self._edges[ch]
+            self._seq += 1
+            heapq.heappush(self._events, (time.monotonic() + delay, self._seq, status, level))
+
+    # ---- libacromag entry points ----
+    def ap_open(self):
+        self._cost()
+        self.is_open = True
+        return 0
+
+    def ap_close(self):
+        self._cost()
+        self.is_open = False
+        return 0
+
+    def ap_read_di(self, ch):
+        self._cost()
+        with self._lock:
+            self._settle()
+            return (self.di >> ch) & 1
+
+    def _read_di_port(self, port):
+        self._cost()
+        with self._lock:
+            self._settle()
+            return (self.di >> (port * DI_PORT_WIDTH)) & 0xFF
+
+    def ap_write_do(self, ch, value):
+        self._cost()
+        with self._lock:
+            self._settle()
+            self._drive(ch, value)
+        return 0
+
+    def _write_do_port(self, port, mask):
+        self._cost()
+        base = port * DO_PORT_WIDTH
+        with self._lock:
+            self._settle()
+            for bit in range(DO_PORT_WIDTH):
+                self._drive(base + bit, (mask >> bit) & 1)
+        return 0
+
+    def ap_read_ai(self, ch):
+        self._cost()
+        return self.ai.get(ch, 0.0) + self._rng.gauss(0.0, AI_NOISE)
+
+    def ap_write_opto_do(self, ch, value):
+        self._cost()
+        if value:
+            self.opto |= 1 << ch
+        else:
+            self.opto &= ~(1 << ch)
+        return 0
+
+    def _write_opto_port(self, port, mask):
+        self._cost()
+        shift = port * OPTO_PORT_WIDTH
+        self.opto = (self.opto & ~(0xFF << shift)) | ((mask & 0xFF) << shift)
+        return 0
@@ -0,0 +1,48 @@
+import pytest
+from apcardmanager import APCardManager, ATTENUATOR_PADS
+from simcard import SimulatedCard
+
+
+@pytest.fixture
+def api():
+    api = APCardManager(card=SimulatedCard())
+    api.ap_open()
+    return api
+
+
+def latch(api, on=()):
+    for name, _ in ATTENUATOR_PADS:
+        api.latched[name] = name in on
+
+
+def named(api, changes):
+    return {(api.registry.names[h], state) for h, state in changes}
+
+
+def test_unknown_pads_are_always_pulsed(api):
+    assert named(api, api.solve_attenuation(0)) == {(name, False) for name, _ in ATTENUATOR_PADS}
+
+
+def test_fewest_relays_from_a_known_state(api):
+    latch(api)
+    changes = api.solve_attenuation(34)
+    assert len(changes) == 2
+    assert sum(db for name, db in ATTENUATOR_PADS if (name, True) in named(api, changes)) == 34
+
+
+def test_reuses_pads_already_in(api):
+    latch(api, on=("A30DB",))
+    assert named(api, api.solve_attenuation(31)) == {("A1DB", True)}
+    assert api.solve_attenuation(30) == []
+
+
+def test_unreachable_target_raises(api):
+    latch(api)
+    with pytest.raises(ValueError):
+        api.solve_attenuation(200)
+
+
+def test_set_attenuation_reports_the_new_total(api):
+    latch(api)
+    assert api.set_attenuation(15) == 15
+    assert api.attenuation() == 15
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from limitengine import LimitEngine, PASS, WARN, FAIL
+
+
+def test_two_sided_pass_warn_fail():
+    engine = LimitEngine({"V": (10.0, 20.0)}, ["V"])
+    status = [engine.evaluate(np.array([v]), 0.0).status[0] for v in (15.0, 10.5, 19.5, 9.0, 21.0)]
+    assert status == [PASS, WARN, WARN, FAIL, FAIL]
+
+
+def test_masks_follow_scan_order():
+    engine = LimitEngine({"A": (0.0, 1.0), "B": (0.0, 1.0), "C": (0.0, 10.0)}, ["A", "B", "C"])
+    result = engine.evaluate(np.array([0.5, 2.0, 9.5]), 1.0)
+    assert result.fail_mask == 0b010
+    assert result.warn_mask == 0b100
+    assert not result.ok
+    assert engine.violations(result) == ["B"]
+
+
+def test_one_sided_limits_get_a_warn_band():
+    engine = LimitEngine({"LOW": (24.0, None), "HIGH": (None, 5.0)}, ["LOW", "HIGH"])
+    result = engine.evaluate(np.array([25.0, 4.8]), 0.0)
+    assert list(result.status) == [WARN, WARN]
+    result = engine.evaluate(np.array([100.0, -100.0]), 0.0)
+    assert list(result.status) == [PASS, PASS]
+
+
+def test_open_channel_never_fails():
+    engine = LimitEngine({"V": (None, None)}, ["V"])
+    assert engine.evaluate(np.array([1e9]), 0.0).ok
+
+
+def test_first_violation_keeps_the_earliest_time():
+    engine = LimitEngine({"V": (0.0, 1.0)}, ["V"])
+    engine.evaluate(np.array([2.0]), 1.0)
+    result = engine.evaluate(np.array([3.0]), 2.0)
+    assert result.first_violation[0] == 1.0
+    engine.reset()
+    assert np.isnan(engine.evaluate(np.array([0.5]), 3.0).first_violation[0])
+
+
+def test_channel_missing_from_the_table_is_refused():
+    with pytest.raises(ValueError, match="B"):
+        LimitEngine({"A": (0.0, 1.0)}, ["A", "B"])
@@ -0,0 +1,97 @@
+from apcardmanager import OutputShadow
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def bit(self, ch, value):
+        self.calls.append(("bit", ch, value))
+        return 0
+
+    def port(self, port, mask):
+        self.calls.append(("port", port, mask))
+        return 0
+
+
+def test_repeat_write_is_skipped_unless_forced():
+    rec = Recorder()
+    out = OutputShadow(rec.bit)
+    out.write(3, 1)
+    out.write(3, 1)
+    out.write(3, 1, force=True)
+    assert rec.calls == [("bit", 3, 1), ("bit", 3, 1)]
+    assert out.skipped == 1
+
+
+def test_per_bit_flush_drops_before_raising():
+    # Set coil on channel 1 must not go high while the reset coil on 2 is still on
+    rec = Recorder()
+    out = OutputShadow(rec.bit)
+    out.write(2, 1)
+    rec.calls.clear()
+    out.begin()
+    out.write(1, 1)
+    out.write(2, 0)
+    out.flush()
+    assert rec.calls == [("bit", 2, 0), ("bit", 1, 1)]
+
+
+def test_raise_first_flush_raises_before_dropping():
+    rec = Recorder()
+    out = OutputShadow(rec.bit, raise_first=True)
+    out.write(0, 1)
+    rec.calls.clear()
+    out.begin()
+    out.write(0, 0)
+    out.write(1, 1)
+    out.flush()
+    assert rec.calls == [("bit", 1, 1), ("bit", 0, 0)]
+
+
+def test_known_port_coalesces_into_one_port_write():
+    rec = Recorder()
+    out = OutputShadow(rec.bit, rec.port, width=8)
+    out.write_port_mask(1, 0x00)
+    rec.calls.clear()
+    out.begin()
+    out.write(8, 1)
+    out.write(11, 1)
+    out.flush()
+    assert rec.calls == [("port", 1, 0x09)]
+    assert out.coalesced == 1
+
+
+def test_unknown_port_state_falls_back_to_bits():
+    rec = Recorder()
+    out = OutputShadow(rec.bit, rec.port, width=8)
+    out.begin()
+    out.write(8, 1)
+    out.write(11, 0)
+    out.flush()
+    assert rec.calls == [("bit", 11, 0), ("bit", 8, 1)]
+
+
+def test_forced_write_is_never_rebuilt_from_the_shadow():
+    # Another process may have changed the port; only the forced lines are written
+    rec = Recorder()
+    out = OutputShadow(rec.bit, rec.port, width=8)
+    out.write_port_mask(0, 0xFF)
+    rec.calls.clear()
+    out.begin()
+    out.write(0, 0, force=True)
+    out.write(1, 0, force=True)
+    out.flush()
+    assert rec.calls == [("bit", 0, 0), ("bit", 1, 0)]
+
+
+def test_redundant_coalesced_write_is_skipped():
+    rec = Recorder()
+    out = OutputShadow(rec.bit)
+    out.write(5, 0)
+    rec.calls.clear()
+    out.begin()
+    out.write(5, 0)
+    out.flush()
+    assert rec.calls == []
+    assert out.skipped == 1
@@ -0,0 +1,45 @@
+import json
+import pyvisa
+import pytest
+from iotrace import ReplayCard, OP_READ_DI, OP_WRITE_DO
+from visatrace import ReplayResourceManager
+
+
+def card(records):
+    replay = ReplayCard(records)
+    replay.ap_open()
+    return replay
+
+
+def test_matching_replay_has_no_mismatches():
+    replay = card([(0, OP_WRITE_DO, 3, 1, 0), (10, OP_READ_DI, 5, 0, 1)])
+    replay.ap_write_do(3, 1)
+    assert replay.ap_read_di(5) == 1
+    assert replay.mismatches == []
+    assert replay.unplayed_writes() == []
+
+
+def test_write_differences_are_recorded():
+    replay = card([(0, OP_WRITE_DO, 3, 1, 0)])
+    replay.ap_write_do(4, 1)
+    replay.ap_write_do(4, 0)
+    assert replay.mismatches == [("write_do", 4, 1, ("write_do", 3, 1)), ("write_do", 4, 0, None)]
+
+
+def test_read_past_the_recording_is_a_mismatch():
+    replay = card([(0, OP_READ_DI, 5, 0, 1)])
+    assert replay.ap_read_di(5) == 1
+    assert replay.ap_read_di(5) == 1
+    assert replay.ap_read_di(6) == 0
+    assert replay.mismatches == [("read_di", 5, None, None), ("read_di", 6, None, None)]
+
+
+def test_unrecorded_query_times_out_as_a_visa_error(tmp_path):
+    path = tmp_path / "visa.jsonl"
+    path.write_text(json.dumps({"t": 0.0, "res": "GPIB0::1::INSTR", "op": "query", "cmd": "*IDN?", "resp": "SIM"}) + "\n")
+    rm = ReplayResourceManager(str(path))
+    inst = rm.open_resource("GPIB0::1::INSTR")
+    assert inst.query("*IDN?") == "SIM"
+    with pytest.raises(pyvisa.VisaIOError):
+        inst.query("*OPC?")
+    assert rm.mismatches == [("GPIB0::1::INSTR", "query *OPC?", None)]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from waveform import NO_PULSE, analysePulse, analyseSegments, pulseStatistics
+
+DT = 1e-9
+
+
+def trapezoid(width, rise, fall, amp=-0.8, n=2000, t0=600e-9):
+    # Negative pulse: falls at t0, rises back width later; edges linear over 10-90 % times
+    t = np.arange(n) * DT
+    lead = np.clip((t - t0) / (fall / 0.8) + 0.5, 0, 1)
+    trail = np.clip((t - t0 - width) / (rise / 0.8) + 0.5, 0, 1)
+    return amp * (lead - trail)
+
+
+def test_negative_pulse_parameters():
+    amp, width, rise, fall = analysePulse(trapezoid(300e-9, 30e-9, 20e-9), DT)
+    assert amp == pytest.approx(0.8, rel=1e-3)
+    assert width == pytest.approx(300e-9, rel=1e-2)
+    assert rise == pytest.approx(30e-9, rel=5e-2)
+    assert fall == pytest.approx(20e-9, rel=5e-2)
+
+
+def test_positive_pulse_parameters():
+    amp, width, rise, fall = analysePulse(-trapezoid(200e-9, 20e-9, 40e-9), DT, negative=False)
+    assert amp == pytest.approx(0.8, rel=1e-3)
+    assert width == pytest.approx(200e-9, rel=1e-2)
+
+
+def test_flat_record_has_no_pulse():
+    assert analysePulse(np.zeros(100), DT) == NO_PULSE
+
+
+def test_pulse_without_trailing_edge_has_no_width():
+    v = trapezoid(5e-6, 30e-9, 20e-9)
+    assert analysePulse(v, DT).width == -1.0
+
+
+def test_segment_statistics_skip_missing_values():
+    segs = np.array([trapezoid(w, 30e-9, 20e-9) for w in (290e-9, 300e-9, 310e-9)] + [np.zeros(2000)])
+    stats = pulseStatistics(analyseSegments(segs, DT))
+    assert stats["width"].count == 3
+    assert stats["width"].mean == pytest.approx(300e-9, rel=1e-2)
+    assert stats["width"].min < stats["width"].max
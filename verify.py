@@ -6,7 +6,7 @@ import random
 import os
 import subprocess
 import sys
-import instrumentManager
+import instrbroker
 import serial
 
 # ================= CONFIG =================
@@ -20,7 +20,8 @@ CHECKSUM_FILES = [
 ]
 
 # ================= INSTRUMENT =================
-instrument = instrumentManager.instr()
+# Shared with every manual window through the instrument broker
+instrument = instrbroker.connect()
 
 # ================= COLORS =================
 OK_BG  = "#064e3b"
@@ -193,6 +194,15 @@ def continue_app():
     root.destroy()
     subprocess.Popen([sys.executable, "login.py"])
 
+# ================= EXIT FUNCTION =================
+def exit_app():
+    # Operator quit: close the instruments (supplies off) instead of waiting for the broker idle timeout
+    try:
+        instrument.shutdown_broker()
+    except Exception:
+        pass
+    root.destroy()
+
 # ================= BUTTONS =================
 button_frame = tk.Frame(root, bg="#020c1b")
 button_frame.pack(pady=22)
@@ -219,9 +229,10 @@ exit_btn = tk.Button(
     width=20,
     height=2,
     cursor="hand2",
-    command=root.destroy
+    command=exit_app
 )
 exit_btn.pack(side="right", padx=30)
 
 # ================= RUN =================
+root.protocol("WM_DELETE_WINDOW", exit_app)
 root.mainloop()
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+import pyvisa
+
+# VISA session recording/replay for instrumentManager.instr, one JSON object per line:
+# {"t": seconds since recording start, "res": resource, "op": write|query|read|read_raw, "cmd": ..., "resp": ...}
+
+
+class RecordingResourceManager:
+    def __init__(self, rm, path):
+        self.rm = rm
+        self.f = open(path, "w")
+        self.t0 = time.monotonic()
+        # Instruments may be driven from several threads (initGpib(parallel=True))
+        self.lock = threading.Lock()
+
+    def log(self, res, op, cmd, resp=None):
+        entry = {"t": round(time.monotonic() - self.t0, 6), "res": res, "op": op, "cmd": cmd}
+        if resp is not None:
+            entry["resp"] = resp
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            self.f.write(line)
+
+    def open_resource(self, name, **kwargs):
+        return RecordingResource(self.rm.open_resource(name, **kwargs), name, self)
+
+    def close(self):
+        self.f.close()
+        self.rm.close()
+
+
+class RecordingResource:
+    def __init__(self, res, name, recorder):
+        object.__setattr__(self, "_res", res)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_rec", recorder)
+
+    def write(self, cmd):
+        ret = self._res.write(cmd)
+        self._rec.log(self._name, "write", cmd)
+        return ret
+
+    def query(self, cmd):
+        resp = self._res.query(cmd)
+        self._rec.log(self._name, "query", cmd, resp)
+        return resp
+
+    def read(self):
+        resp = self._res.read()
+        self._rec.log(self._name, "read", "", resp)
+        return resp
+
+    def read_raw(self, *args):
+        resp = self._res.read_raw(*args)
+        self._rec.log(self._name, "read_raw", "", resp.hex())
+        return resp
+
+    def __getattr__(self, name):
+        return getattr(self._res, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._res, name, value)
+
+
+class ReplayResourceManager:
+    # Answers queries from a recording; writes are checked against the recorded
+    # sequence per resource and every difference lands in .mismatches. A query with
+    # no recorded answer is a mismatch and times out like the instrument would.
+    def __init__(self, path, realtime=False):
+        self.realtime = realtime
+        self.mismatches = []
+        self.start = time.monotonic()
+        self.writes = defaultdict(deque)
+        self.responses = defaultdict(deque)
+        with open(path) as f:
+            for line in f:
+                e = json.loads(line)
+                if e["op"] == "write":
+                    self.writes[e["res"]].append((e["t"], e["cmd"]))
+                else:
+                    self.responses[e["res"], e["op"], e["cmd"]].append((e["t"], e.get("resp", "")))
+
+    def open_resource(self, name, **kwargs):
+        if name not in self.writes and not any(key[0] == name for key in self.responses):
+            raise ValueError(f"replay: {name} not in recording")
+        return ReplayResource(name, self)
+
+    def hold(self, t):
+        if self.realtime:
+            wait = self.start + t - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def unplayed_writes(self):
+        return {res: list(cmds) for res, cmds in self.writes.items() if cmds}
+
+    def close(self):
+        pass
+
+
+class ReplayResource:
+    def __init__(self, name, replay):
+        self.name = name
+        self.replay = replay
+        self.timeout = 2000
+
+    def write(self, cmd):
+        expected = self.replay.writes[self.name]
+        if not expected:
+            self.replay.mismatches.append((self.name, cmd, None))
+            return len(cmd)
+        t, recorded = expected.popleft()
+        self.replay.hold(t)
+        if recorded != cmd:
+            self.replay.mismatches.append((self.name, cmd, recorded))
+        return len(cmd)
+
+    def _answer(self, op, cmd):
+        queue = self.replay.responses.get((self.name, op, cmd))
+        if not queue:
+            self.replay.mismatches.append((self.name, f"{op} {cmd}".rstrip(), None))
+            raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        t, resp = queue.popleft() if len(queue) > 1 else queue[0]
+        self.replay.hold(t)
+        return resp
+
+    def query(self, cmd):
+        return self._answer("query", cmd)
+
+    def read(self):
+        return self._answer("read", "")
+
+    def read_raw(self, *args):
+        return bytes.fromhex(self._answer("read_raw", ""))
+
+    def close(self):
+        pass
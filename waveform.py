@@ -0,0 +1,127 @@
+import time
+from collections import namedtuple
+import numpy as np
+
+PulseParams = namedtuple("PulseParams", "amplitude width rise fall")
+NO_PULSE = PulseParams(-1.0, -1.0, -1.0, -1.0)
+PulseStats = namedtuple("PulseStats", "mean stdev min max count")
+
+# :WAV:PRE? fields, InfiniiVision order
+PREAMBLE = ("format", "type", "points", "count", "xinc", "xorig", "xref", "yinc", "yorig", "yref")
+
+
+class Waveform:
+    # One record as transferred: the raw block is kept for audit, codes is a view into it
+    def __init__(self, channel, preamble, raw, timestamp=None, segments=1):
+        self.channel = channel
+        self.segments = segments
+        self.preamble = dict(zip(PREAMBLE, (float(v) for v in preamble.strip().split(","))))
+        self.raw = raw
+        self.timestamp = time.time() if timestamp is None else timestamp
+        digits = int(raw[1:2])
+        length = int(raw[2:2 + digits])
+        self.codes = np.frombuffer(raw, dtype="<i2", count=length // 2, offset=2 + digits)
+        p = self.preamble
+        self.volts = (self.codes - p["yref"]) * p["yinc"] + p["yorig"]
+        self.dt = p["xinc"]
+        self.t0 = p["xorig"] - p["xref"] * p["xinc"]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def segmentVolts(self):
+        # (segments, points) view of a segmented record, sized from the preamble points
+        # per segment; a short record keeps only the segments that came back whole
+        per = int(self.preamble["points"]) or len(self.volts)
+        n = min(self.segments, len(self.volts) // per)
+        return self.volts[:n * per].reshape(n, per)
+
+    def times(self):
+        return self.t0 + np.arange(len(self.codes)) * self.dt
+
+    def save(self, path):
+        np.savez(path, channel=self.channel, timestamp=self.timestamp, raw=np.frombuffer(self.raw, dtype=np.uint8),
+                 volts=self.volts, t0=self.t0, dt=self.dt)
+
+
+def crossings(v, level, rising):
+    # Fractional sample indices where v crosses level in the given direction
+    above = v >= level
+    idx = np.flatnonzero(above[1:] != above[:-1])
+    idx = idx[above[idx + 1]] if rising else idx[~above[idx + 1]]
+    a = v[idx]
+    return idx + (level - a) / (v[idx + 1] - a)
+
+
+def _before(edges, t):
+    i = np.searchsorted(edges, t, side="right") - 1
+    return edges[i] if i >= 0 else None
+
+
+def _after(edges, t):
+    i = np.searchsorted(edges, t, side="left")
+    return edges[i] if i < len(edges) else None
+
+
+def analysePulse(volts, dt, negative=True):
+    # Top/base from the medians of the two halves, 10/50/90 % crossings with linear
+    # interpolation; width at 50 %, rise and fall between 10 % and 90 %
+    v = np.asarray(volts, dtype=np.float64)
+    if len(v) < 3:
+        return NO_PULSE
+    mid = (v.max() + v.min()) / 2
+    top = np.median(v[v >= mid])
+    base = np.median(v[v < mid]) if np.any(v < mid) else mid
+    amp = top - base
+    if amp <= 0:
+        return NO_PULSE
+    lo, half, hi = base + 0.1 * amp, base + 0.5 * amp, base + 0.9 * amp
+
+    # A negative pulse leads with its falling edge
+    lead = crossings(v, half, rising=not negative)
+    trail = crossings(v, half, rising=negative)
+    if not len(lead):
+        return PulseParams(amp, -1.0, -1.0, -1.0)
+    t_lead = lead[0]
+    t_trail = _after(trail, t_lead)
+    width = (t_trail - t_lead) * dt if t_trail is not None else -1.0
+
+    fall_hi, fall_lo = crossings(v, hi, rising=False), crossings(v, lo, rising=False)
+    rise_lo, rise_hi = crossings(v, lo, rising=True), crossings(v, hi, rising=True)
+    t_fall = t_lead if negative else t_trail
+    t_rise = t_trail if negative else t_lead
+    fall = rise = -1.0
+    if t_fall is not None:
+        a, b = _before(fall_hi, t_fall), _after(fall_lo, t_fall)
+        if a is not None and b is not None:
+            fall = (b - a) * dt
+    if t_rise is not None:
+        a, b = _before(rise_lo, t_rise), _after(rise_hi, t_rise)
+        if a is not None and b is not None:
+            rise = (b - a) * dt
+    return PulseParams(float(amp), float(width), float(rise), float(fall))
+
+
+def analyseSegments(volts, dt, negative=True):
+    # One PulseParams row per segment of a (segments, points) array
+    return np.array([analysePulse(seg, dt, negative) for seg in volts], dtype=np.float64).reshape(-1, len(PulseParams._fields))
+
+
+def inWidth(params, low, high):
+    # Rows of analyseSegments() whose width lies strictly inside (low, high)
+    width = params[:, PulseParams._fields.index("width")]
+    return params[(width > low) & (width < high)]
+
+
+def pulseStatistics(params):
+    # Per-parameter statistics over the segment rows, skipping values not found (-1)
+    stats = {}
+    for i, name in enumerate(PulseParams._fields):
+        col = params[:, i]
+        col = col[col >= 0]
+        if not len(col):
+            stats[name] = PulseStats(-1.0, -1.0, -1.0, -1.0, 0)
+            continue
+        stdev = float(col.std(ddof=1)) if len(col) > 1 else 0.0
+        stats[name] = PulseStats(float(col.mean()), stdev, float(col.min()), float(col.max()), len(col))
+    return stats